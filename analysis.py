@@ -0,0 +1,259 @@
+"""Cached LLM analysis of the relationship between two system concepts."""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_MODEL = os.getenv('ANALYSIS_MODEL', 'gpt-4')
+ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS', 4))
+ANALYSIS_CACHE_SIZE = int(os.getenv('ANALYSIS_CACHE_SIZE', 512))
+ANALYSIS_CACHE_TTL = int(os.getenv('ANALYSIS_CACHE_TTL', 7 * 86400))
+ANALYSIS_CACHE_DIR = os.getenv('ANALYSIS_CACHE_DIR')
+ANALYSIS_RETRY_AFTER = int(os.getenv('ANALYSIS_RETRY_AFTER', 60))
+MAX_RELATIONSHIPS = 3
+
+
+def normalize_concepts(concept1, concept2):
+    return tuple(' '.join((concept or '').split()).casefold() for concept in (concept1, concept2))
+
+
+def cache_key(concept1, concept2):
+    return hashlib.sha256(json.dumps(normalize_concepts(concept1, concept2)).encode()).hexdigest()
+
+
+class RedisTier:
+    def __init__(self, client, prefix='recce:analysis:', ttl=ANALYSIS_CACHE_TTL):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+
+class DiskTier:
+    def __init__(self, directory, ttl=ANALYSIS_CACHE_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, value):
+        tmp_path = f'{self._path(key)}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(value, f)
+        os.replace(tmp_path, self._path(key))
+
+
+class AnalysisCache:
+    """In-memory LRU with TTL, backed by an optional shared tier."""
+
+    def __init__(self, max_entries=ANALYSIS_CACHE_SIZE, ttl=ANALYSIS_CACHE_TTL, tier=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.tier = tier
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return ``(value, source)`` where source is 'memory', 'tier' or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    return value, 'memory'
+                del self._entries[key]
+        if self.tier is not None:
+            try:
+                value = self.tier.get(key)
+            except Exception as e:
+                logger.warning(f"Analysis cache tier lookup failed: {e}")
+                value = None
+            if value is not None:
+                self._remember(key, value)
+                return value, 'tier'
+        return None, None
+
+    def set(self, key, value):
+        self._remember(key, value)
+        if self.tier is not None:
+            try:
+                self.tier.set(key, value)
+            except Exception as e:
+                logger.warning(f"Analysis cache tier write failed: {e}")
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class ConceptAnalyzer:
+    """Runs concept analyses in the background and memoizes their results.
+
+    ``client`` is anything exposing ``chat.completions.create`` (the
+    ``openai`` module by default), so a local fake can stand in for it.
+    """
+
+    def __init__(self, client=None, cache=None, workers=ANALYSIS_WORKERS, model=ANALYSIS_MODEL):
+        self.client = client
+        self.cache = cache or AnalysisCache()
+        self.model = model
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analysis')
+        self._inflight = {}
+        self._failed = {}
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'tier_hits': 0, 'misses': 0, 'errors': 0,
+                       'llm_calls': 0, 'llm_seconds': 0.0, 'llm_max_seconds': 0.0}
+
+    def start(self, concept1, concept2):
+        """Make sure an analysis is cached or in flight; return its future or None."""
+        key = cache_key(concept1, concept2)
+        if self._lookup(key) is not None:
+            return None
+        with self._lock:
+            if self._recently_failed(key):
+                return None
+            return self._submit(key, concept1, concept2)
+
+    def peek(self, concept1, concept2, start=False):
+        """Return ``(ready, relationships)`` without blocking.
+
+        With ``start``, a pair that is neither cached nor in flight is
+        analyzed in the background, as by :meth:`start`, in the same lookup.
+        """
+        key = cache_key(concept1, concept2)
+        relationships = self._lookup(key)
+        if relationships is not None:
+            return True, relationships
+        with self._lock:
+            # A recent failure counts as ready so callers fall back instead of waiting
+            if self._recently_failed(key):
+                return True, None
+            if start:
+                self._submit(key, concept1, concept2)
+            return False, None
+
+    def result(self, concept1, concept2, timeout=None):
+        """Return the relationships for a pair, starting the analysis if needed."""
+        key = cache_key(concept1, concept2)
+        relationships = self._lookup(key)
+        if relationships is not None:
+            return relationships
+        with self._lock:
+            if self._recently_failed(key):
+                return None
+            future = self._submit(key, concept1, concept2)
+        return future.result(timeout=timeout)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['inflight'] = len(self._inflight)
+        lookups = stats['memory_hits'] + stats['tier_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['tier_hits']) / lookups if lookups else 0.0
+        stats['llm_avg_seconds'] = stats['llm_seconds'] / stats['llm_calls'] if stats['llm_calls'] else 0.0
+        return stats
+
+    def _recently_failed(self, key):
+        retry_at = self._failed.get(key)
+        if retry_at is None:
+            return False
+        if retry_at <= time.monotonic():
+            del self._failed[key]
+            return False
+        return True
+
+    def _submit(self, key, concept1, concept2):
+        # Called with the lock held, so concurrent requests share one analysis
+        future = self._inflight.get(key)
+        if future is None:
+            self._stats['misses'] += 1
+            future = self._inflight[key] = self._executor.submit(self._analyze, key, concept1, concept2)
+        return future
+
+    def _lookup(self, key):
+        value, source = self.cache.get(key)
+        if source:
+            with self._lock:
+                self._stats[f'{source}_hits'] += 1
+        return value
+
+    def _analyze(self, key, concept1, concept2):
+        started = time.monotonic()
+        try:
+            client = self.client
+            if client is None:
+                if not os.getenv('OPENAI_API_KEY'):
+                    raise RuntimeError("OpenAI API key not set")
+                import openai
+                client = openai
+            with span('analysis.llm'):
+                response = client.chat.completions.create(
+                    model=self.model,
+                    messages=[{
+                        "role": "system",
+                        "content": "You are a systems analyst. Given two concepts, describe their relationship in a system."
+                    }, {
+                        "role": "user",
+                        "content": f"Analyze the relationship between {concept1} and {concept2} in a system. "
+                                   f"Respond with only 2-3 key connections between them."
+                    }]
+                )
+            content = response.choices[0].message.content or ''
+            relationships = [line.strip() for line in content.split('\n') if line.strip()][:MAX_RELATIONSHIPS]
+            self.cache.set(key, relationships)
+            return relationships
+        except Exception as e:
+            logger.error(f"Concept analysis failed for {concept1!r}, {concept2!r}: {e}")
+            with self._lock:
+                self._stats['errors'] += 1
+                self._failed[key] = time.monotonic() + ANALYSIS_RETRY_AFTER
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._inflight.pop(key, None)
+                self._stats['llm_calls'] += 1
+                self._stats['llm_seconds'] += elapsed
+                self._stats['llm_max_seconds'] = max(self._stats['llm_max_seconds'], elapsed)
+
+
+def create_analyzer(client=None):
+    tier = None
+    redis_url = os.getenv('REDIS_URL')
+    if redis_url:
+        import redis
+        tier = RedisTier(redis.Redis.from_url(redis_url))
+    elif ANALYSIS_CACHE_DIR:
+        tier = DiskTier(ANALYSIS_CACHE_DIR)
+    return ConceptAnalyzer(client=client, cache=AnalysisCache(tier=tier))
@@ -0,0 +1,96 @@
+"""Capture-time aggregation of the API calls a site makes."""
+import os
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+MAX_ENDPOINTS = int(os.getenv('API_MAX_ENDPOINTS', 500))
+API_RESOURCE_TYPES = ('xhr', 'fetch')
+
+_SEGMENT_PATTERNS = (
+    (re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.I), '{uuid}'),
+    (re.compile(r'^\d+$'), '{id}'),
+    (re.compile(r'^[0-9a-f]{16,}$', re.I), '{hash}'),
+    (re.compile(r'^(?=.*\d)[A-Za-z0-9_-]{20,}$'), '{token}'),
+)
+
+
+def endpoint_template(url):
+    """Return ``url`` without its query, with variable path segments replaced.
+
+    ``https://api.example.com/users/123/orders?page=2`` becomes
+    ``https://api.example.com/users/{id}/orders``.
+    """
+    parsed = urlparse(url)
+    segments = []
+    for segment in parsed.path.split('/'):
+        for pattern, placeholder in _SEGMENT_PATTERNS:
+            if pattern.match(segment):
+                segment = placeholder
+                break
+        segments.append(segment)
+    return f"{parsed.scheme}://{parsed.netloc}{'/'.join(segments)}"
+
+
+class ApiCallAggregator:
+    """Per-endpoint counters for a task's API calls with a hard endpoint cap.
+
+    Calls are grouped by method and endpoint template as they are captured.
+    Each endpoint keeps a call count, status code counts, response sizes and
+    timings. Once ``max_endpoints`` endpoints exist, calls to new endpoints
+    only increase ``dropped``, so memory stays flat however noisy the site is.
+    """
+
+    def __init__(self, max_endpoints=MAX_ENDPOINTS):
+        self.max_endpoints = max_endpoints
+        self.dropped = 0
+        self._endpoints = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, method, url, status=None, size=None, duration=None):
+        """Record one call and return its endpoint entry if the endpoint is new."""
+        template = endpoint_template(url)
+        key = (method, template)
+        with self._lock:
+            entry = self._endpoints.get(key)
+            is_new = entry is None
+            if is_new:
+                if len(self._endpoints) >= self.max_endpoints:
+                    self.dropped += 1
+                    return None
+                entry = self._endpoints[key] = {
+                    'method': method, 'endpoint': template, 'count': 0, 'statuses': {},
+                    'sized': 0, 'bytes': 0, 'max_bytes': 0, 'timed': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                }
+            entry['count'] += 1
+            status_key = str(status) if status is not None else 'failed'
+            entry['statuses'][status_key] = entry['statuses'].get(status_key, 0) + 1
+            if size is not None and size >= 0:
+                entry['sized'] += 1
+                entry['bytes'] += size
+                entry['max_bytes'] = max(entry['max_bytes'], size)
+            if duration is not None and duration >= 0:
+                entry['timed'] += 1
+                entry['total_ms'] += duration
+                entry['max_ms'] = max(entry['max_ms'], duration)
+            return {'method': method, 'endpoint': template} if is_new else None
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = []
+            for entry in self._endpoints.values():
+                endpoints.append({
+                    'method': entry['method'],
+                    'endpoint': entry['endpoint'],
+                    'count': entry['count'],
+                    'statuses': dict(entry['statuses']),
+                    'avg_bytes': round(entry['bytes'] / entry['sized']) if entry['sized'] else None,
+                    'max_bytes': entry['max_bytes'],
+                    'avg_ms': round(entry['total_ms'] / entry['timed'], 1) if entry['timed'] else None,
+                    'max_ms': round(entry['max_ms'], 1),
+                })
+            return endpoints
+
+    def __len__(self):
+        return len(self._endpoints)
@@ -1,63 +1,93 @@
-from flask import Flask, render_template, request, session, jsonify
+from flask import Flask, Response, abort, render_template, request, send_from_directory, session, jsonify
 from datetime import datetime
 import os
 import uuid
 import json
-import requests
-import boto3
-from bs4 import BeautifulSoup
-from playwright.sync_api import sync_playwright
-from anytree import Node, RenderTree
 from urllib.parse import urlparse
 import logging
 import threading
-from collections import defaultdict
+import time
+import asyncio
+import atexit
 from functools import partial
-import openai
-try:
-    import graphviz
-except ImportError:
-    print("Warning: graphviz package not available")
-    graphviz = None
-import stripe
+import crawler
+import metrics
+from metrics import span
+from browser_pool import BrowserPool
+from capture import MAX_PAGE_HEIGHT, TILE_THRESHOLD, capture_pages, iter_tiles, page_height
+from thumbnails import Thumbnail
+from profiles import BLOCKED_FAILURE, PROFILES, CaptureStats, get_profile
+from uploads import UploadQueue, gather
+from storage import create_storage
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from task_store import TERMINAL_STATUSES, create_task_store
+from scheduler import Busy, Scheduler
+from crawl_cache import CrawlCache
+from fingerprint import FingerprintIndex, dom_fingerprint, image_fingerprint, normalize_url, site_key
+from sitemap_tree import SitemapCache
+from analysis import create_analyzer
+from api_calls import API_RESOURCE_TYPES, ApiCallAggregator
+from diagram import DiagramRenderer, build_concept_diagram, build_default_diagram, graphviz_available
 
 app = Flask(__name__)
-stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
 app.secret_key = 'development-secret-key'  # Fixed secret key for development
 app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for testing
 app.config['SESSION_COOKIE_SECURE'] = False  # Allow session cookie over HTTP
 app.config['SESSION_COOKIE_HTTPONLY'] = False  # Allow JS access to session cookie
 app.config['SESSION_COOKIE_SAMESITE'] = None  # Allow cross-site requests
-s3 = boto3.client('s3', region_name='ca-central-1')  
+storage = create_storage()  # S3 by default, or local disk with STORAGE_BACKEND=local
+upload_queue = UploadQueue(storage)
+ARTIFACT_MAX_AGE = 86400  # Artifact keys are unique per task, so served files never change
 
-# Initialize OpenAI client
-openai.api_key = os.getenv('OPENAI_API_KEY')
-
-# Install browsers
-os.system("playwright install chromium")
-
-def upload_file_to_s3(file_path, bucket_name, object_name):
-    try:
-        s3.upload_file(file_path, bucket_name, object_name)
-        logger.info(f"Uploaded {object_name} to S3 bucket {bucket_name}.")
-    except Exception as e:
-        logger.error(f"Failed to upload {object_name} to S3: {e}")
-
-def generate_presigned_url(bucket_name, object_name, expiration=3600):
-    try:
-        response = s3.generate_presigned_url('get_object',
-                                             Params={'Bucket': bucket_name, 'Key': object_name},
-                                             ExpiresIn=expiration)
-        return response
-    except Exception as e:
-        logger.error(f"Failed to generate presigned URL for {object_name}: {e}")
-        return None
+# Shared Chromium processes, started on first capture and reused across tasks.
+# Chromium itself is installed at build time by bin/post_compile, not here.
+browser_pool = BrowserPool()
+atexit.register(browser_pool.shutdown)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-tasks = defaultdict(dict)  # Global dictionary to store task status and results
+tasks = create_task_store()  # Task status and results, shared across workers when REDIS_URL is set
+scheduler = Scheduler(tasks)  # Fixed crawl and capture pools; coalescing and cancels go through tasks
+SSE_WAIT_SECONDS = float(os.getenv('SSE_WAIT_SECONDS', 0.5))
+SSE_RETRY_MS = int(os.getenv('SSE_RETRY_MS', 1000))
+API_FLUSH_INTERVAL = 1.0
+crawl_cache = CrawlCache()  # Page validators and links shared by every crawl in this worker
+fingerprints = FingerprintIndex()  # Page fingerprints to uploaded artifacts, per site
+sitemap_cache = SitemapCache()  # Sitemap tries and rendered fragments per task
+analyzer = create_analyzer()  # Memoized concept analyses, run in the background
+diagram_renderer = DiagramRenderer()  # SVGs cached by DOT source, bounded dot processes
+if graphviz_available():
+    diagram_renderer.warm(build_default_diagram)
+
+TASKS_FINISHED = metrics.REGISTRY.counter('recce_tasks_finished_total', 'Tasks that reached a terminal status.')
+TASKS_REJECTED = metrics.REGISTRY.counter('recce_scheduler_rejected_total', 'Submissions turned away as busy.')
+# Gauges read the module globals at scrape time, so replaced instances are picked up
+metrics.REGISTRY.gauge('recce_upload_queue_depth', 'Uploads waiting for an upload worker.',
+                       lambda: upload_queue.depth())
+metrics.REGISTRY.gauge('recce_browsers', 'Pooled Chromium processes.', lambda: browser_pool.stats()['browsers'])
+metrics.REGISTRY.gauge('recce_browser_active_contexts', 'Browser contexts leased to tasks.',
+                       lambda: browser_pool.stats()['active_contexts'])
+metrics.REGISTRY.gauge('recce_scheduler_queued', 'Task stages waiting for a worker.',
+                       lambda: [({'stage': stage}, count) for stage, count in scheduler.stats()['queued'].items()])
+metrics.REGISTRY.gauge('recce_scheduler_running', 'Task stages being worked on.',
+                       lambda: [({'stage': stage}, count) for stage, count in scheduler.stats()['running'].items()])
+metrics.REGISTRY.gauge('recce_analysis_inflight', 'Concept analyses waiting on the LLM.',
+                       lambda: analyzer.stats()['inflight'])
+metrics.REGISTRY.gauge('recce_cache_hit_ratio', 'Hit ratio of each cache since worker start.', lambda: [
+    ({'cache': 'crawl'}, crawl_cache.stats()['hit_rate']),
+    ({'cache': 'analysis'}, analyzer.stats()['hit_rate']),
+    ({'cache': 'diagram'}, diagram_renderer.stats()['hit_rate']),
+    ({'cache': 'fingerprint'}, fingerprints.stats()['hit_rate']),
+    ({'cache': 'storage_url'}, storage.stats().get('urls', {}).get('hit_rate')),
+])
+
+def stripe_client():
+    # Imported on first checkout; the SDK is slow to import and most workers never need it
+    import stripe
+    stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
+    return stripe
 
 def generate_task_id():
     return str(uuid.uuid4())
@@ -66,28 +96,26 @@ def generate_task_id():
 def index():
     if request.method == 'POST':
         try:
-            logger.info(f"Received POST request with form data: {request.form}")
+            logger.debug(f"Received POST request with form data: {request.form}")
             url = request.form.get('url')
             concept1 = request.form.get('concept1')
             concept2 = request.form.get('concept2')
+            try:
+                depth = int(request.form.get('depth') or crawler.MAX_DEPTH)
+            except ValueError:
+                depth = crawler.MAX_DEPTH
+            depth = max(1, min(depth, crawler.MAX_DEPTH))
+            profile = get_profile(request.form.get('profile')).name
             logger.info(f"Parsed values - url: {url}, concept1: {concept1}, concept2: {concept2}")
-            logger.info(f"Session before update: {dict(session)}")
-            
-            # Store concepts in session
-            session['concept1'] = concept1
-            session['concept2'] = concept2
-            task_id = generate_task_id()
-            session['task_id'] = task_id
-            session.modified = True
-            logger.info(f"Stored in session - concept1: {session.get('concept1')}, concept2: {session.get('concept2')}")
-            logger.info(f"Session contents: {dict(session)}")
-            
+            logger.debug(f"Session before update: {dict(session)}")
+
             # Require at least URL or both concepts
             if not url and not (concept1 and concept2):
                 return render_template('error.html', error_message="Please provide either a URL or both system concepts"), 400
                 
             # Validate URL if provided
             if url:
+                import requests  # Only URL submissions need it; keeps it out of worker boot
                 try:
                     parsed = urlparse(url)
                     if not parsed.netloc:
@@ -97,10 +125,12 @@ def index():
                         if not parsed.netloc:
                             raise ValueError("Invalid URL format")
                     
-                    # Test if URL is reachable
-                    if url:  # Only test if URL is provided
-                        response = requests.head(url, timeout=5)
+                    # Test if URL is reachable, unless a recent crawl or probe already reached it
+                    if not crawl_cache.is_reachable(url):
+                        with span('submit.probe'):
+                            response = requests.head(url, timeout=5)
                         response.raise_for_status()
+                        crawl_cache.mark_reachable(url)
                 except (ValueError, requests.RequestException) as e:
                     logger.error(f"URL validation error: {e}")
                     return render_template('error.html', error_message=f"Unable to access URL: {str(e)}"), 400
@@ -108,283 +138,408 @@ def index():
             # Store concepts in session
             session['concept1'] = concept1
             session['concept2'] = concept2
+            session_id = session.setdefault('session_id', uuid.uuid4().hex)
             task_id = generate_task_id()
+
+            if url:
+                # Admit the crawl, or join an identical one already in flight on any worker
+                try:
+                    task_id, coalesced = scheduler.admit(session_id, task_id,
+                                                         key=(normalize_url(url), depth, profile),
+                                                         status='queued', url=url, profile=profile)
+                except Busy as e:
+                    TASKS_REJECTED.inc()
+                    logger.warning(f"Rejected task for {url}: {e}")
+                    return render_template('error.html', error_message="Recce is busy with other analyses. "
+                                           "Please try again in a minute."), 503, {'Retry-After': '30'}
+                if coalesced:
+                    logger.info(f"Joined in-flight task {task_id} for {url}")
+                else:
+                    scheduler.schedule(task_id, 'crawl', partial(generate_sitemap_task, url=url, max_depth=depth,
+                                                                 profile=profile))
+            else:
+                tasks.create(task_id, status='running', url=url)
+                set_task_status(task_id, 'complete', finished=True)
             session['task_id'] = task_id
             session.modified = True
+            logger.debug(f"Session contents: {dict(session)}")
 
-            # Start background thread for sitemap generation
-            sitemap_thread = threading.Thread(target=generate_sitemap_task, args=(url, task_id))
-            sitemap_thread.start()
+            if concept1 and concept2:
+                # Start the LLM analysis now so the diagram endpoint only reads its result
+                analyzer.start(concept1, concept2)
 
             # Render the template immediately
             current_year = datetime.now().year
-            return render_template('index.html', analysis_complete=False, current_year=current_year)
+            return render_template('index.html', analysis_complete=False, current_year=current_year,
+                                   profiles=PROFILES.values(), default_profile=get_profile().name)
         except Exception as e:
             logger.error(f"Error processing request: {e}")
             return render_template('error.html', error_message=str(e)), 500
     else:
         current_year = datetime.now().year
-        return render_template('index.html', analysis_complete=False, current_year=current_year)
+        return render_template('index.html', analysis_complete=False, current_year=current_year,
+                               profiles=PROFILES.values(), default_profile=get_profile().name)
+
+def set_task_status(task_id, status, finished=False, **fields):
+    if status != 'cancelled' and tasks.get_field(task_id, 'cancel_requested'):
+        # Cancelled from another worker; this one stops at its next cancellation check
+        return
+    # Publish before finishing so the final event shares the task's TTL
+    tasks.publish(task_id, 'status', {'status': status, **fields})
+    timeline = metrics.timeline(task_id)
+    if finished:
+        TASKS_FINISHED.inc(status=status)
+        metrics.discard_timeline(task_id)
+        tasks.finish(task_id, status=status, timeline=timeline, **fields)
+    else:
+        tasks.update(task_id, status=status, timeline=timeline, **fields)
 
-def generate_sitemap_task(url, task_id):
+def generate_sitemap_task(job, url, max_depth=None, profile=None):
+    task_id = job.task_id
+    metrics.bind_task(task_id)
     try:
-        tasks[task_id]['status'] = 'running'
-        sitemap_urls = generate_sitemap(url, task_id)
-        tasks[task_id]['sitemap_urls'] = sitemap_urls
-        tasks[task_id]['status'] = 'sitemap_complete'
-
-        # Start screenshot capturing in another thread
-        screenshot_thread = threading.Thread(target=capture_screenshots_task, args=(task_id, sitemap_urls))
-        screenshot_thread.start()
+        set_task_status(task_id, 'running')
+        with span('sitemap'):
+            sitemap_urls = generate_sitemap(url, task_id, max_depth, cancelled=job.cancelled)
+        if job.cancelled.is_set():
+            return
+        set_task_status(task_id, 'sitemap_complete')
+
+        # Queue screenshot capture on the capture pool
+        scheduler.schedule(task_id, 'capture', partial(capture_screenshots_task, urls=sitemap_urls, profile=profile))
     except Exception as e:
         logger.error(f"Error in generate_sitemap_task: {e}")
-        tasks[task_id]['status'] = 'failed'
-        tasks[task_id]['error'] = str(e)
+        if not job.cancelled.is_set():
+            set_task_status(task_id, 'failed', finished=True, error=str(e))
 
-def capture_screenshots_task(task_id, urls):
+def capture_screenshots_task(job, urls, profile=None):
+    task_id = job.task_id
+    metrics.bind_task(task_id)
     try:
-        tasks[task_id]['status'] = 'capturing_screenshots'
-        capture_screenshots(task_id, urls)
-        tasks[task_id]['status'] = 'complete'
+        set_task_status(task_id, 'capturing_screenshots')
+        with span('screenshots'):
+            capture_screenshots(task_id, urls, job, profile)
+        if not job.cancelled.is_set():
+            set_task_status(task_id, 'complete', finished=True)
     except Exception as e:
+        if job.cancelled.is_set():
+            logger.info(f"Screenshot capture for task {task_id} cancelled")
+            return
         logger.error(f"Error in capture_screenshots_task: {e}")
-        tasks[task_id]['status'] = 'failed'
-        tasks[task_id]['error'] = str(e)
-
-def generate_sitemap(start_url, task_id):
-    visited = set()
-    to_visit = [start_url]
-    sitemap = []
-    base_url = '{uri.scheme}://{uri.netloc}'.format(uri=urlparse(start_url))
-
-    while to_visit:
-        url = to_visit.pop()
-        if url in visited or len(visited) >= 10:  # Limit to 10 pages
-            continue
-        visited.add(url)
-        sitemap.append(url)
-        try:
-            response = requests.get(url, timeout=10)
-            soup = BeautifulSoup(response.text, 'html.parser')
-            for link in soup.find_all('a', href=True):
-                href = link['href']
-                if href.startswith('/'):
-                    href = requests.compat.urljoin(base_url, href)
-                elif not href.startswith('http'):
-                    href = requests.compat.urljoin(url, href)
-                if href.startswith(base_url) and href not in visited:
-                    to_visit.append(href)
-        except Exception as e:
-            logger.warning(f"Error crawling {url}: {e}")
-            continue
+        set_task_status(task_id, 'failed', finished=True, error=str(e))
 
-    return sitemap
+def generate_sitemap(start_url, task_id, max_depth=None, cancelled=None):
+    if max_depth is None:
+        max_depth = crawler.MAX_DEPTH
 
-def build_sitemap_tree(urls):
-    from anytree import Node, RenderTree
-    from urllib.parse import urlparse
+    def record_url(url):
+        index = tasks.append(task_id, 'sitemap_urls', url) - 1
+        sitemap_cache.add(task_id, url, index)
+        tasks.publish(task_id, 'sitemap_url', {'url': url})
 
-    nodes = {}
-    root = Node('root', url='')
+    sitemap = crawler.crawl(start_url, max_depth=max_depth, on_url=record_url, cache=crawl_cache,
+                            cancelled=cancelled)
+    logger.info(f"Crawled {len(sitemap)} pages for task {task_id}")
+    return sitemap
 
+def capture_screenshots(task_id, urls, job=None, profile=None):
+    profile = get_profile(profile)
+    capture_stats = CaptureStats(profile)
+    unique_urls = {}
     for url in urls:
-        parsed = urlparse(url)
-        path_parts = [part for part in parsed.path.strip('/').split('/') if part]
-        current_parent = root
-
-        for idx, part in enumerate(path_parts):
-            full_url = f"{parsed.scheme}://{parsed.netloc}/{'/'.join(path_parts[:idx+1])}"
-            # Check if a node with this part already exists under the current parent
-            existing_node = next((child for child in current_parent.children if child.name == part), None)
-            if existing_node:
-                current_parent = existing_node
-            else:
-                new_node = Node(part, parent=current_parent, url=full_url)
-                current_parent = new_node
-
-    # Build the tree lines with HTML links
-    sitemap_tree = []
-    for pre, _, node in RenderTree(root):
-        if node.is_root:
-            continue  # Skip the root node
-        link = f'<a href="{node.url}" target="_blank">{node.name}</a>'
-        line = f"{pre}{link}"
-        sitemap_tree.append(line)
-
-    return sitemap_tree
-
-def capture_screenshots_task(task_id, urls):
-    processed_urls = set()  # Keep track of processed URLs to prevent duplicates
+        if url:
+            unique_urls.setdefault(normalize_url(url), url)  # Drop equivalent URLs, keep order
+    unique_urls = list(unique_urls.values())
     screenshot_urls = []
-    tasks[task_id]['api_calls'] = []
-    logger.info(f"Starting screenshot capture for task {task_id}")
-    logger.info(f"Initial API calls count: {len(tasks[task_id].get('api_calls', []))}")
+    shown_artifacts = set()
+    shown_lock = threading.Lock()
+    duplicates = 0
+    recorded = []  # One future per uploaded page, set once its screenshot is recorded
+    api_calls = ApiCallAggregator()
+    last_api_flush = 0.0
+    # Task store writes can be Redis round trips, so request handlers on the pool loop
+    # queue them here instead of stalling every page; one thread keeps them in order
+    writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='task-writer')
     logger.info(f"Starting screenshot capture for task {task_id}")
-    logger.info(f"Starting screenshot capture for task {task_id}")
-
-    with sync_playwright() as p:
-        try:
-            browser = p.chromium.launch(headless=True)
-            context = browser.new_context(viewport={'width': 1280, 'height': 720})
-            page = context.new_page()
-        except Exception as e:
-            logger.error(f"Failed to launch browser: {e}")
-            return []
-        context = browser.new_context(viewport={'width': 1280, 'height': 720})
-
-        def log_api_request(request):
-            if request.resource_type in ["xhr", "fetch"]:
-                api_call = {
-                    'url': request.url,
-                    'method': request.method,
-                    'headers': dict(request.headers)
-                }
-                tasks[task_id]['api_calls'].append(api_call)
-                logger.info(f"Captured API call: {request.method} {request.url}")
-                logger.info(f"Current API calls count: {len(tasks[task_id].get('api_calls', []))}")
-                logger.info(f"API call details: {api_call}")
-                logger.info(f"Current API calls count: {len(tasks[task_id].get('api_calls', []))}")
-                logger.info(f"API call details: {api_call}")
-
-        context.on("request", log_api_request)
-        page = context.new_page()
-
-        for idx, url in enumerate(urls):
-            if url in processed_urls:
-                continue
-            processed_urls.add(url)
 
+    def write_later(fn, *args, **kwargs):
+        def run():
             try:
-                if url:  # Only try to capture screenshot if URL is provided
-                    page.goto(url, timeout=30000)
-                page.wait_for_load_state('networkidle')
-                page.wait_for_selector('img', state='visible', timeout=10000)
-                page.evaluate('window.scrollTo(0, document.body.scrollHeight)')
-                page.wait_for_timeout(2000)
-                page.evaluate('window.scrollTo(0, 0)')
-                page.wait_for_timeout(1000)
-
-                # Get page title for filename
-                title = page.title()
-                safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_'))[:50]
-                screenshot_filename = f'{safe_title}_{idx + 1}.png'
-                object_name = f'{task_id}/screenshots/{screenshot_filename}'
-
-                # Take screenshot and upload to S3
-                screenshot = page.screenshot(full_page=True)
-                s3.put_object(Bucket='recce-results', Key=object_name, Body=screenshot, ContentType='image/png')
-                screenshot_url = generate_presigned_url('recce-results', object_name, expiration=86400)
-
-                screenshot_urls.append({'url': screenshot_url, 'filename': screenshot_filename})
-                tasks[task_id]['screenshot_urls'] = screenshot_urls
-                logger.info(f"Captured and uploaded screenshot for {url}")
+                fn(*args, **kwargs)
             except Exception as e:
-                logger.warning(f"Failed to capture screenshot for {url}: {e}")
-
-        page.close()
-        context.close()
-        browser.close()
+                logger.warning(f"Task store write failed for task {task_id}: {e}")
+        try:
+            writer.submit(run)
+        except RuntimeError:
+            logger.debug(f"Dropped a task store write after capture ended for task {task_id}")
+
+    def write_api_calls():
+        tasks.update(task_id, api_endpoints=api_calls.snapshot(), api_calls_dropped=api_calls.dropped,
+                     capture=capture_stats.snapshot(), timeline=metrics.timeline(task_id))
+
+    def flush_api_calls():
+        # Endpoint stats change on every call, so write the snapshot at most once a second
+        nonlocal last_api_flush
+        now = time.monotonic()
+        if now - last_api_flush >= API_FLUSH_INTERVAL:
+            last_api_flush = now
+            write_later(write_api_calls)
+
+    def record_api_call(request, status, size):
+        timing = request.timing
+        duration = timing['responseEnd'] if timing.get('responseEnd', -1) >= 0 else None
+        endpoint = api_calls.record(request.method, request.url, status, size, duration)
+        if endpoint:
+            write_later(tasks.publish, task_id, 'api_call', endpoint)
+            logger.info(f"Discovered API endpoint: {endpoint['method']} {endpoint['endpoint']}")
+        flush_api_calls()
+
+    async def log_api_request(request):
+        if request.resource_type not in API_RESOURCE_TYPES:
+            return
+        status = size = None
+        try:
+            response = await request.response()
+            status = response.status if response else None
+            size = (await request.sizes())['responseBodySize']
+        except Exception as e:
+            logger.debug(f"Could not read response details for {request.url}: {e}")
+        record_api_call(request, status, size)
+
+    def log_failed_api_request(request):
+        # Calls the capture profile blocked are trackers, not the site's API
+        if request.resource_type in API_RESOURCE_TYPES and request.failure != BLOCKED_FAILURE:
+            record_api_call(request, None, None)
+
+    def show_screenshot(artifact, url):
+        # Pages that fingerprint to an artifact this task already shows are not shown twice
+        nonlocal duplicates
+        with shown_lock:
+            if artifact['key'] in shown_artifacts:
+                duplicates += 1
+                tasks.update(task_id, duplicate_screenshots=duplicates)
+                logger.info(f"Skipped duplicate screenshot for {url}")
+                return
+            shown_artifacts.add(artifact['key'])
+        screenshot = dict(artifact)
+        screenshot_urls.append(screenshot)
+        tasks.append(task_id, 'screenshot_urls', screenshot)
+        tasks.publish(task_id, 'screenshot', screenshot)
+
+    def record_screenshot(artifact, url, site, page_fingerprints, done, upload):
+        # Runs on an upload thread; `done` lets the capture thread wait for the
+        # recording itself, not just the upload, before the task is finished
+        try:
+            _record_screenshot(artifact, url, site, page_fingerprints, upload)
+        finally:
+            done.set_result(None)
+
+    def _record_screenshot(artifact, url, site, page_fingerprints, upload):
+        # Only report screenshots whose uploads have all been confirmed
+        if upload.exception():
+            fingerprints.resolve(site, page_fingerprints, None)
+            logger.warning(f"Failed to upload screenshot for {url}: {upload.exception()}")
+            return
+        urls = upload.result()
+        artifact = dict(artifact, url=urls[0])
+        if 'tiles' in artifact:
+            artifact['tiles'] = [dict(tile, url=tile_url) for tile, tile_url in zip(artifact['tiles'], urls)]
+        if 'thumbnail_key' in artifact:
+            artifact['thumbnail'] = urls[-1]
+        fingerprints.resolve(site, page_fingerprints, artifact)
+        show_screenshot(artifact, url)
+        logger.info(f"Captured and uploaded screenshot for {url}")
+
+    async def capture_tiles(page, object_name, height):
+        # Long pages go up as fixed-height slices, each queued for upload as soon as it
+        # is taken, so memory per page stays at one tile plus a small thumbnail
+        truncated = height > MAX_PAGE_HEIGHT
+        height = min(height, MAX_PAGE_HEIGHT)
+        stem = object_name.rsplit('.', 1)[0]
+        thumbnail = Thumbnail(page.viewport_size['width'], height)
+        tiles = []
+        tile_uploads = []
+        async for y, tile_height, png in iter_tiles(page, height, **profile.screenshot_options()):
+            key = f'{stem}/tile_{len(tiles) + 1:03d}.png'
+            tile_uploads.append(await asyncio.to_thread(upload_queue.submit, key, png))
+            tiles.append({'key': key, 'y': y, 'height': tile_height})
+            with span('capture.thumbnail'):
+                await asyncio.to_thread(thumbnail.add, png, y)
+        artifact = {'key': tiles[0]['key'], 'tiles': tiles, 'height': height, 'truncated': truncated,
+                    'thumbnail_key': f'{stem}/thumbnail.jpg'}
+        jpeg = await asyncio.to_thread(thumbnail.to_jpeg)
+        tile_uploads.append(await asyncio.to_thread(upload_queue.submit, artifact['thumbnail_key'],
+                                                    jpeg, 'image/jpeg'))
+        if truncated:
+            logger.info(f"Captured the top {height}px of {page.url} in {len(tiles)} tiles")
+        return artifact, gather(tile_uploads)
+
+    async def capture_page(page, idx, url):
+        # Fingerprint the rendered DOM before paying for a full-page capture and upload
+        # Profiles render pages differently, so their screenshots are never interchangeable
+        site = f'{site_key(page.url)}#{profile.name}'
+        with span('capture.fingerprint'):
+            dom_hash = await dom_fingerprint(page)
+        reservation, owner = fingerprints.reserve(site, dom_hash)
+        if not owner:
+            # Shielded: cancelling this task must not cancel the future other tasks share
+            artifact = await asyncio.shield(asyncio.wrap_future(reservation))
+            if artifact is not None:
+                await asyncio.to_thread(show_screenshot, artifact, url)
+                return
 
+        try:
+            # Get page title for filename
+            title = await page.title()
+            safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_'))[:50]
+            screenshot_filename = f'{safe_title}_{idx + 1}.png'
+            object_name = f'{task_id}/screenshots/{screenshot_filename}'
+
+            height = await page_height(page)
+            if height > TILE_THRESHOLD:
+                # Tiles are uploaded while they are taken, before an image hash could be
+                # compared, so long pages are only deduplicated by their DOM fingerprint
+                artifact, upload = await capture_tiles(page, object_name, height)
+                image_hash = None
+            else:
+                with span('capture.screenshot'):
+                    screenshot = await page.screenshot(full_page=True, **profile.screenshot_options())
+                with span('capture.image_hash'):
+                    image_hash = await asyncio.to_thread(image_fingerprint, screenshot)
+                # Only a byte-identical screenshot is reused; near matches are uploaded
+                artifact = fingerprints.lookup(site, image_hash)
+                if artifact is not None:
+                    fingerprints.resolve(site, [dom_hash], artifact)
+                    await asyncio.to_thread(show_screenshot, artifact, url)
+                    return
+
+                # Hand the screenshot to the upload queue and move on to the next page
+                artifact = {'key': object_name}
+                upload = gather([await asyncio.to_thread(upload_queue.submit, object_name, screenshot)])
+        except BaseException:
+            fingerprints.resolve(site, [dom_hash], None)
+            raise
+        artifact['filename'] = screenshot_filename
+        done = Future()
+        recorded.append(done)
+        upload.add_done_callback(partial(record_screenshot, artifact, url, site, [dom_hash, image_hash], done))
+
+    async def capture(context):
+        metrics.bind_task(task_id)  # The pool loop does not inherit this thread's context
+        context.on("requestfinished", log_api_request)
+        context.on("requestfailed", log_failed_api_request)
+        await capture_pages(context, unique_urls, capture_page, profile=profile, stats=capture_stats)
+
+    capture_run = browser_pool.submit(capture, viewport={'width': 1280, 'height': 720},
+                                      **profile.context_options())
+    # Cancelling the run cancels its coroutine, which closes the open pages and the context
+    unregister = job.on_cancel(capture_run.cancel) if job else None
+    try:
+        capture_run.result()
+    finally:
+        if unregister:
+            unregister()
+        writer.shutdown(wait=True)  # Queued writes land before the final snapshot below
+    write_api_calls()
+    summary = capture_stats.snapshot()
+    logger.info(f"Captured {summary['pages']} pages for task {task_id} with the {profile.name} profile: "
+                f"{summary['mean_page_bytes']} bytes and {summary['mean_load_ms']} ms per page, "
+                f"{summary['blocked']} requests blocked, about {summary['saved_bytes_estimate']} bytes saved")
+    wait(recorded)
     return screenshot_urls
 
 @app.route('/task_status')
 def task_status():
     task_id = session.get('task_id')
-    if not task_id or task_id not in tasks:
+    task_info = tasks.get(task_id) if task_id else None
+    if task_info is None:
         return jsonify({'status': 'no_task'})
 
-    task_info = tasks[task_id]
     return jsonify(task_info)
 
+@app.route('/cancel_task', methods=['POST'])
+def cancel_task():
+    task_id = session.get('task_id')
+    outcome = scheduler.cancel(task_id, session.get('session_id')) if task_id else None
+    if outcome == 'cancelled':
+        set_task_status(task_id, 'cancelled', finished=True)
+    elif outcome == 'detached':
+        # Other sessions still follow the task, so it keeps running for them
+        session.pop('task_id', None)
+    return jsonify({'status': outcome or 'not_running'})
+
+@app.route('/task_events')
+def task_events():
+    task_id = session.get('task_id')
+    if not task_id or not tasks.exists(task_id):
+        return Response(status=204)  # Tells EventSource not to reconnect
+
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        last_id = 0
+    if tasks.get_field(task_id, 'status') in TERMINAL_STATUSES and not tasks.events_since(task_id, last_id):
+        return Response(status=204)
+
+    def stream():
+        # Long-poll style: wait at most SSE_WAIT_SECONDS, flush the pending events and end
+        # the response, so an idle tab never holds a worker thread. The browser reconnects
+        # after SSE_RETRY_MS and resumes from the last event id it saw
+        yield f'retry: {SSE_RETRY_MS}\n\n'
+        for event_id, event, data in tasks.wait_for_events(task_id, last_id, timeout=SSE_WAIT_SECONDS):
+            yield f'id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n'
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/sitemap_content')
 def sitemap_content():
     task_id = session.get('task_id')
-    if not task_id or task_id not in tasks:
+    if not task_id or not tasks.exists(task_id):
         return '<pre>No sitemap available.</pre>'
 
-    sitemap_urls = tasks[task_id].get('sitemap_urls', [])
-    sitemap_tree = build_sitemap_tree(sitemap_urls)
-    return render_template('partials/sitemap_content.html', sitemap_tree=sitemap_tree)
+    return sitemap_cache.fragment(
+        task_id,
+        tasks.count(task_id, 'sitemap_urls'),
+        lambda start: tasks.get_list(task_id, 'sitemap_urls', start),
+        lambda sitemap_tree: render_template('partials/sitemap_content.html', sitemap_tree=sitemap_tree),
+    )
+
+def refresh_urls(screenshot):
+    # Stored presigned URLs expire, so links are refreshed from the storage's URL cache
+    if 'key' not in screenshot:
+        return screenshot
+    screenshot = dict(screenshot, url=storage.url(screenshot['key']))
+    if 'tiles' in screenshot:
+        screenshot['tiles'] = [dict(tile, url=storage.url(tile['key'])) for tile in screenshot['tiles']]
+    if 'thumbnail_key' in screenshot:
+        screenshot['thumbnail'] = storage.url(screenshot['thumbnail_key'])
+    return screenshot
 
 @app.route('/screenshots_content')
 def screenshots_content():
     task_id = session.get('task_id')
-    if not task_id or task_id not in tasks:
-        return '<div>No screenshots available.</div>'
+    if not task_id or not tasks.exists(task_id):
+        return '<div class="empty">No screenshots available.</div>'
 
-    screenshot_urls = tasks[task_id].get('screenshot_urls', [])
+    screenshot_urls = [refresh_urls(screenshot) for screenshot in tasks.get_field(task_id, 'screenshot_urls', [])]
     return render_template('partials/screenshots_content.html', screenshot_urls=screenshot_urls)
 
-import openai
-import graphviz
-
 # Function to generate a system diagram
-def generate_system_diagram(concept1, concept2):
-    if not graphviz:
+def generate_system_diagram(concept1, concept2, relationships=None):
+    if not graphviz_available():
         logger.error("Graphviz not available")
         return None
-        
+
     try:
-        logger.info(f"Generating system diagram with concepts: {concept1}, {concept2}")
-        if not os.getenv('OPENAI_API_KEY'):
-            logger.error("OpenAI API key not set")
-            return None
         if concept1 and concept2:
-            logger.info("Using concept analysis")
-        else:
-            logger.info("Using default diagram")
-        logger.info("Starting diagram generation...")
-        logger.info("Using default diagram" if not concept1 and not concept2 else "Using concept analysis")
-        logger.info("Starting diagram generation...")
-        logger.info("Using default diagram" if not concept1 and not concept2 else "Using concept analysis")
-        logger.info("Starting diagram generation...")
-        
-        # Create diagram
-        dot = graphviz.Digraph(format='svg')
-        dot.attr(rankdir='LR')
-        
-        if concept1 or concept2:
-            # Get system analysis from OpenAI
-            response = openai.chat.completions.create(
-                model="gpt-4",
-                messages=[{
-                    "role": "system",
-                    "content": "You are a systems analyst. Given two concepts, describe their relationship in a system."
-                }, {
-                    "role": "user", 
-                    "content": f"Analyze the relationship between {concept1} and {concept2} in a system. "
-                              f"Respond with only 2-3 key connections between them."
-                }]
-            )
-            
-            # Add nodes and relationships from LLM
-            dot.node(concept1, concept1)
-            dot.node(concept2, concept2)
-            relationships = response.choices[0].message.content.split('\n')
-            for i, rel in enumerate(relationships[:3]):
-                dot.edge(concept1, concept2, rel)
+            # Add nodes and relationships from the cached LLM analysis
+            if relationships is None:
+                relationships = analyzer.result(concept1, concept2) or []
+            dot = build_concept_diagram(concept1, concept2, relationships)
         else:
-            # Default diagram showing the site analysis system
-            dot.attr(rankdir='LR')
-            dot.attr(size='8,8!')  # Force diagram size
-            dot.attr(ratio='fill')  # Fill available space
-            dot.node('Browser', 'Browser\n(Screenshots + API Calls)')
-            dot.node('Flask', 'Flask Server\n(URL Processing)')
-            dot.node('S3', 'AWS S3\n(Image Storage)')
-            dot.node('OpenAI', 'OpenAI API\n(Systems Analysis)')
-            
-            # Show data flow with compact spacing
-            dot.edge('Browser', 'Flask', 'URL Analysis Request')
-            dot.edge('Flask', 'Browser', 'Sitemap Data')
-            dot.edge('Flask', 'S3', 'Store Screenshots')
-            dot.edge('S3', 'Browser', 'Load Images')
-            dot.edge('Flask', 'OpenAI', 'System Analysis')
-            dot.edge('OpenAI', 'Browser', 'System Insights')
-            
-            svg_output = dot.pipe().decode('utf-8')
-            logger.info("Successfully generated system diagram")
-            logger.info(f"SVG output length: {len(svg_output) if svg_output else 0} characters")
-            return svg_output
+            dot = build_default_diagram()
+        return diagram_renderer.render(dot)
     except Exception as e:
         logger.error(f"Error generating system diagram: {e}")
         return None
@@ -393,67 +548,55 @@ def generate_system_diagram(concept1, concept2):
 def systems_diagram():
     try:
         task_id = session.get('task_id')
-        logger.info("Systems diagram endpoint called")
-        concept1 = session.get('concept1')
-        concept2 = session.get('concept2')
-        logger.info(f"Retrieved from session - concept1: {concept1}, concept2: {concept2}")
-        logger.info(f"Session contents: {dict(session)}")
-        logger.info(f"Session ID: {request.cookies.get('session')}")
-        if not task_id or task_id not in tasks:
-            logger.info("Generating default system diagram")
-            logger.info("Starting diagram generation...")
-            diagram_svg = generate_system_diagram(None, None)  # Generate default diagram
-            logger.info("Default diagram generated successfully" if diagram_svg else "Failed to generate default diagram")
-            return render_template('partials/systems_diagram.html', diagram_svg=diagram_svg)
-            
         concept1 = session.get('concept1')
         concept2 = session.get('concept2')
-            
-        diagram_svg = generate_system_diagram(concept1, concept2)
-        if not task_id or task_id not in tasks:
-            logger.info("Generating default system diagram")
-            logger.info("Starting diagram generation...")
+        if not task_id or not tasks.exists(task_id) or not (concept1 and concept2):
             diagram_svg = generate_system_diagram(None, None)  # Generate default diagram
-            logger.info("Default diagram generated successfully" if diagram_svg else "Failed to generate default diagram")
             return render_template('partials/systems_diagram.html', diagram_svg=diagram_svg)
-            
-        concept1 = session.get('concept1')
-        concept2 = session.get('concept2')
-            
-        diagram_svg = generate_system_diagram(concept1, concept2)
+
+        # The analysis was started by the POST to /; restart it only if it has since been evicted
+        ready, relationships = analyzer.peek(concept1, concept2, start=True)
+        if not ready:
+            return render_template('partials/systems_diagram.html', pending=True)
+        if relationships is None:
+            diagram_svg = generate_system_diagram(None, None)  # Analysis failed, fall back to default
+        else:
+            diagram_svg = generate_system_diagram(concept1, concept2, relationships)
         return render_template('partials/systems_diagram.html', diagram_svg=diagram_svg)
     except Exception as e:
         logger.error(f"Error generating system diagram: {e}")
         return '<pre>Error generating system diagram</pre>'
 
+@app.route('/artifacts/<path:key>')
+def artifact(key):
+    # Only the local backend serves files itself; S3 artifacts are read through presigned URLs
+    if storage.backend != 'local':
+        abort(404)
+    # send_from_directory streams the file and answers Range and conditional requests
+    response = send_from_directory(storage.root, key, conditional=True, max_age=ARTIFACT_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/stats')
+def stats():
+    return jsonify({'analysis': analyzer.stats(), 'diagrams': diagram_renderer.stats(),
+                    'crawl_cache': crawl_cache.stats(), 'fingerprints': fingerprints.stats(),
+                    'scheduler': scheduler.stats(), 'storage': storage.stats()})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api_calls_content')
 def api_calls_content():
     task_id = session.get('task_id')
-    if not task_id or task_id not in tasks:
+    if not task_id or not tasks.exists(task_id):
         logger.info("No task_id found for API calls")
-        return '<div>No API calls available.</div>'
-
-    api_calls = tasks[task_id].get('api_calls', [])
-    logger.info(f"Found {len(api_calls)} API calls for task {task_id}")
-    logger.info(f"API calls: {api_calls}")
-    # Deduplicate API calls
-    seen = set()
-    unique_calls = []
-    for call in api_calls:
-        key = call['method'] + ' ' + call['url'].split('?')[0]
-        if key not in seen:
-            seen.add(key)
-            unique_calls.append(call)
-    return render_template('partials/api_calls_content.html', api_calls=unique_calls)
-    # Deduplicate API calls
-    seen = set()
-    unique_calls = []
-    for call in api_calls:
-        key = call['method'] + ' ' + call['url'].split('?')[0]
-        if key not in seen:
-            seen.add(key)
-            unique_calls.append(call)
-    return render_template('partials/api_calls_content.html', api_calls=unique_calls)
+        return '<div class="empty">No API calls available.</div>'
+
+    api_endpoints = tasks.get_field(task_id, 'api_endpoints', [])
+    dropped = tasks.get_field(task_id, 'api_calls_dropped', 0)
+    return render_template('partials/api_calls_content.html', api_endpoints=api_endpoints, dropped=dropped)
 
 # Error handlers
 @app.errorhandler(404)
@@ -487,7 +630,7 @@ def login():
 @app.route('/create-checkout-session', methods=['POST'])
 def create_checkout_session():
     try:
-        checkout_session = stripe.checkout.Session.create(
+        checkout_session = stripe_client().checkout.Session.create(
             payment_method_types=['card'],
             line_items=[{
                 'price': os.getenv('STRIPE_PRICE_ID'),
@@ -508,7 +651,7 @@ def success():
     if session_id:
         try:
             # Verify the session with Stripe
-            checkout_session = stripe.checkout.Session.retrieve(session_id)
+            checkout_session = stripe_client().checkout.Session.retrieve(session_id)
             if checkout_session.payment_status == "paid":
                 # Store subscription info in session
                 session['subscribed'] = True
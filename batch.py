@@ -0,0 +1,246 @@
+"""Headless batch analysis of many sites, one JSONL record per site.
+
+Usage: python batch.py sites.txt --output results.jsonl [--workers 4] [--contexts 2]
+
+Reads one URL per line from a file (or ``-`` for stdin) and runs the crawl,
+screenshot capture and API-call aggregation pipeline for each site across
+``--workers`` processes, each capturing up to ``--contexts`` sites at once in
+its own browser. A record is appended to the output as soon as a site
+finishes, so the output doubles as the checkpoint: rerun with ``--resume``
+after an interruption to skip the sites already recorded.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+DEFAULT_CONTEXTS = 2
+RESULT_POLL_SECONDS = 1.0
+
+
+def read_urls(source):
+    """URLs from ``source`` in order, without blanks, ``#`` comments or repeats."""
+    urls = []
+    seen = set()
+    for line in source:
+        url = line.strip()
+        if url and not url.startswith('#') and url not in seen:
+            seen.add(url)
+            urls.append(url)
+    return urls
+
+
+def completed_urls(path):
+    """Inputs already recorded in the output at ``path``, dropping a torn last line."""
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    valid_bytes = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                done.add(json.loads(line)['input'])
+            except (ValueError, KeyError):
+                break
+            valid_bytes += len(line)
+    if valid_bytes != os.path.getsize(path):
+        # A run killed mid-write leaves a partial record; cut it so appends stay valid JSONL
+        logger.warning(f"Truncating {path} after {len(done)} complete records")
+        with open(path, 'r+b') as f:
+            f.truncate(valid_bytes)
+    return done
+
+
+def analyze_site(recce, url, options):
+    """Run the pipeline for one site in a worker and return its record."""
+    import crawler
+    import metrics
+    from metrics import span
+
+    started = time.perf_counter()
+    target = url if url.startswith(('http://', 'https://')) else 'https://' + url
+    task_id = str(uuid.uuid4())
+    record = {'input': url, 'url': target, 'status': 'complete', 'error': None, 'pages': [],
+              'screenshots': [], 'api_endpoints': [], 'api_calls_dropped': 0, 'capture': None}
+    recce.tasks.create(task_id, status='running', url=target)
+    metrics.bind_task(task_id)
+    try:
+        with span('sitemap'):
+            record['pages'] = crawler.crawl(target, max_depth=options['depth'], max_pages=options['max_pages'],
+                                            cache=recce.crawl_cache)
+        if options['capture'] and record['pages']:
+            with span('screenshots'):
+                record['screenshots'] = recce.capture_screenshots(task_id, record['pages'],
+                                                                  profile=options['profile'])
+            info = recce.tasks.get(task_id) or {}
+            for field in ('api_endpoints', 'api_calls_dropped', 'capture'):
+                record[field] = info.get(field, record[field])
+    except Exception as e:
+        logger.error(f"Failed to analyze {url}: {e}")
+        record.update(status='failed', error=str(e))
+    finally:
+        record['timeline'] = metrics.timeline(task_id)
+        metrics.discard_timeline(task_id)
+        recce.tasks.finish(task_id, status=record['status'])
+    record['elapsed_s'] = round(time.perf_counter() - started, 2)
+    record['worker'] = os.getpid()
+    record['finished_at'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    return record
+
+
+def _worker(jobs, results, options):
+    # One browser per worker process, with a context for each site it runs at once
+    os.environ['BROWSER_POOL_SIZE'] = '1'
+    os.environ['BROWSER_CONTEXTS_PER_BROWSER'] = str(options['contexts'])
+    import app as recce
+    from task_store import MemoryTaskStore
+    logging.getLogger().setLevel(options['log_level'])
+    recce.tasks = MemoryTaskStore()  # Records go back to the parent; nothing is shared through Redis
+
+    def run_sites():
+        while True:
+            url = jobs.get()
+            if url is None:
+                return
+            results.put(analyze_site(recce, url, options))
+
+    threads = [threading.Thread(target=run_sites, name=f'site-{i}') for i in range(options['contexts'])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    recce.browser_pool.shutdown()
+
+
+class Progress:
+    """Counts finished sites and reports throughput in sites per minute."""
+
+    def __init__(self, total, skipped):
+        self.total = total
+        self.skipped = skipped
+        self.statuses = {}
+        self.started = time.perf_counter()
+
+    @property
+    def finished(self):
+        return sum(self.statuses.values())
+
+    def sites_per_minute(self):
+        elapsed = time.perf_counter() - self.started
+        return self.finished / elapsed * 60 if elapsed else 0.0
+
+    def record(self, record):
+        self.statuses[record['status']] = self.statuses.get(record['status'], 0) + 1
+        rate = self.sites_per_minute()
+        remaining = self.total - self.finished
+        eta = f"{remaining / rate:.0f} min left" if rate else "-"
+        print(f"[{self.finished}/{self.total}] {record['status']:8} {record['input']} "
+              f"({record['elapsed_s']}s, {rate:.1f} sites/min, {eta})", file=sys.stderr)
+
+    def summary(self):
+        return {
+            'sites': self.total,
+            'finished': self.finished,
+            'skipped': self.skipped,
+            'statuses': self.statuses,
+            'wall_time_s': round(time.perf_counter() - self.started, 1),
+            'sites_per_minute': round(self.sites_per_minute(), 2),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('input', help="file with one URL per line, or - for stdin")
+    parser.add_argument('--output', '-o', default='batch-results.jsonl', help="JSONL output and checkpoint")
+    parser.add_argument('--resume', action='store_true', help="skip sites already in the output")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="worker processes")
+    parser.add_argument('--contexts', type=int, default=DEFAULT_CONTEXTS,
+                        help="sites each worker analyzes at once, one browser context each")
+    parser.add_argument('--depth', type=int, default=None, help="crawl depth (default: CRAWL_MAX_DEPTH)")
+    parser.add_argument('--max-pages', type=int, default=None, help="pages per site (default: CRAWL_MAX_PAGES)")
+    parser.add_argument('--profile', default=None, help="capture profile: fast, faithful or api-discovery")
+    parser.add_argument('--no-capture', dest='capture', action='store_false',
+                        help="only crawl; skip screenshots and API calls")
+    parser.add_argument('--log-level', default='WARNING', help="log level inside the workers")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    if args.input == '-':
+        urls = read_urls(sys.stdin)
+    else:
+        with open(args.input) as f:
+            urls = read_urls(f)
+    if args.resume:
+        done = completed_urls(args.output)
+    elif os.path.exists(args.output) and os.path.getsize(args.output):
+        parser.error(f"{args.output} already has results; pass --resume to continue it or remove it")
+    else:
+        done = set()
+    pending = [url for url in urls if url not in done]
+    progress = Progress(len(pending), len(urls) - len(pending))
+    if not pending:
+        print(json.dumps(progress.summary()))
+        return
+
+    import crawler
+    options = {
+        'contexts': max(1, args.contexts),
+        'depth': args.depth or crawler.MAX_DEPTH,
+        'max_pages': args.max_pages or crawler.MAX_PAGES,
+        'profile': args.profile,
+        'capture': args.capture,
+        'log_level': args.log_level.upper(),
+    }
+    workers = max(1, min(args.workers, len(pending)))
+    # Workers import the app and start Chromium themselves, so nothing is forked mid-thread
+    context = multiprocessing.get_context('spawn')
+    jobs = context.Queue()
+    results = context.Queue()
+    for url in pending:
+        jobs.put(url)
+    for _ in range(workers * options['contexts']):
+        jobs.put(None)
+    processes = [context.Process(target=_worker, args=(jobs, results, options), name=f'batch-{i}')
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+
+    try:
+        with open(args.output, 'a') as output:
+            workers_exited = False
+            while progress.finished < len(pending):
+                try:
+                    record = results.get(timeout=RESULT_POLL_SECONDS)
+                except queue.Empty:
+                    # Poll once more after the workers exit, for records sent just before
+                    if workers_exited:
+                        logger.error("All workers exited before every site finished")
+                        break
+                    workers_exited = not any(process.is_alive() for process in processes)
+                    continue
+                output.write(json.dumps(record) + '\n')
+                output.flush()
+                progress.record(record)
+    except KeyboardInterrupt:
+        logger.warning(f"Interrupted; rerun with --resume to continue from {args.output}")
+        for process in processes:
+            process.terminate()
+    for process in processes:
+        process.join()
+    print(json.dumps(progress.summary()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Local stand-ins for S3, OpenAI and Stripe used by the benchmark server."""
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+
+class FakeS3:
+    """Accepts uploads after ``latency`` seconds and keeps only their sizes."""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.objects = {}
+        self.presigned = 0
+        self._lock = threading.Lock()
+
+    def upload_fileobj(self, fileobj, bucket, key, ExtraArgs=None, Config=None):
+        size = len(fileobj.read())
+        time.sleep(self.latency)
+        with self._lock:
+            self.objects[f'{bucket}/{key}'] = size
+
+    def upload_file(self, filename, bucket, key, ExtraArgs=None, Config=None):
+        with open(filename, 'rb') as f:
+            self.upload_fileobj(f, bucket, key, ExtraArgs, Config)
+
+    def generate_presigned_url(self, operation, Params=None, ExpiresIn=3600):
+        with self._lock:
+            self.presigned += 1
+        return f"http://fake-s3.local/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+    def stats(self):
+        with self._lock:
+            return {'objects': len(self.objects), 'bytes': sum(self.objects.values()), 'presigned': self.presigned}
+
+
+class _FakeCompletions:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, model, messages, **kwargs):
+        time.sleep(self.owner.latency)
+        with self.owner._lock:
+            self.owner.calls += 1
+        content = '\n'.join(f'{i}. Synthetic connection {i}' for i in range(1, 4))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FakeOpenAI:
+    """Exposes ``chat.completions.create`` answering after ``latency`` seconds."""
+
+    def __init__(self, latency=1.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self))
+
+    def stats(self):
+        return {'calls': self.calls}
+
+
+class _FakeCheckoutSession:
+    @staticmethod
+    def create(**kwargs):
+        return SimpleNamespace(id=f'cs_test_{uuid.uuid4().hex}')
+
+    @staticmethod
+    def retrieve(session_id):
+        return SimpleNamespace(id=session_id, payment_status='paid', subscription=f'sub_{session_id}')
+
+
+class FakeStripe:
+    """Module-shaped stand-in for the parts of ``stripe`` the app calls."""
+    api_key = None
+    checkout = SimpleNamespace(Session=_FakeCheckoutSession)
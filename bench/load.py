@@ -0,0 +1,304 @@
+"""End-to-end load benchmark for Recce.
+
+Starts the synthetic site and the app (with local S3/OpenAI/Stripe fakes)
+under gunicorn, then runs ``--users`` concurrent users. Each user submits a
+task with ``POST /`` and polls ``/task_status`` and the fragment endpoints
+the UI loads until the task finishes, as a browser tab would.
+
+Usage: python bench/load.py --users 4 --tasks-per-user 2 --pages 30
+
+Results are printed and saved as JSON under ``bench/results/`` (or
+``--output``) so runs can be compared over time. Use one worker unless
+``REDIS_URL`` is set, since tasks live in worker memory otherwise.
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+from synthetic_site import SiteConfig, SyntheticSite
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+FRAGMENTS = ('/sitemap_content', '/screenshots_content', '/api_calls_content', '/systems_diagram')
+TERMINAL_STATUSES = ('complete', 'failed', 'cancelled')
+BOOT_TIMEOUT = 60
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize_ms(samples):
+    if not samples:
+        return None
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 50) * 1000, 1),
+        'p95_ms': round(percentile(samples, 95) * 1000, 1),
+        'p99_ms': round(percentile(samples, 99) * 1000, 1),
+        'max_ms': round(max(samples) * 1000, 1),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 1),
+    }
+
+
+class Recorder:
+    """Thread-safe latency samples per endpoint."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def request(self, session, method, base_url, path, **kwargs):
+        name = f'{method} {path}'
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, timeout=60, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self.errors[name] = self.errors.get(name, 0) + 1
+            return None
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies.setdefault(name, []).append(elapsed)
+            if response.status_code >= 500:
+                self.errors[name] = self.errors.get(name, 0) + 1
+        return response
+
+    def summary(self):
+        with self._lock:
+            return {name: {**summarize_ms(samples), 'errors': self.errors.get(name, 0)}
+                    for name, samples in sorted(self.latencies.items())}
+
+
+class RssSampler(threading.Thread):
+    """Polls ``/_bench/stats`` to track worker memory during the run."""
+
+    def __init__(self, base_url, interval=1.0):
+        super().__init__(name='rss-sampler', daemon=True)
+        self.base_url = base_url
+        self.interval = interval
+        self.workers = {}
+        self.last = None
+        self._stop_event = threading.Event()
+
+    def sample(self):
+        try:
+            stats = requests.get(self.base_url + '/_bench/stats', timeout=5).json()
+        except (requests.RequestException, ValueError):
+            return
+        worker = self.workers.setdefault(stats['pid'], {'start_rss_bytes': stats['rss_bytes'],
+                                                        'peak_rss_bytes': 0})
+        worker['peak_rss_bytes'] = max(worker['peak_rss_bytes'], stats['rss_bytes'])
+        worker['end_rss_bytes'] = stats['rss_bytes']
+        worker['max_rss_bytes'] = stats['max_rss_bytes']
+        self.last = stats
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.sample()
+
+
+def run_task(base_url, site_url, args, recorder):
+    session = requests.Session()
+    started = time.perf_counter()
+    result = {'status': None, 'time_to_first_sitemap': None, 'time_to_first_screenshot': None,
+              'total': None, 'sitemap_urls': 0, 'screenshots': 0,
+              'page_bytes': None, 'page_load_ms': None, 'blocked_requests': None, 'saved_bytes_estimate': None}
+    form = {'url': site_url, 'depth': args.depth, 'profile': args.profile}
+    if args.concepts:
+        form.update(concept1=args.concepts[0], concept2=args.concepts[1])
+    response = recorder.request(session, 'POST', base_url, '/', data=form)
+    if response is None or response.status_code != 200:
+        result['status'] = 'submit_failed'
+        return result
+
+    while time.perf_counter() - started < args.task_timeout:
+        response = recorder.request(session, 'GET', base_url, '/task_status')
+        info = response.json() if response is not None and response.ok else {}
+        elapsed = time.perf_counter() - started
+        result['sitemap_urls'] = len(info.get('sitemap_urls') or [])
+        result['screenshots'] = len(info.get('screenshot_urls') or [])
+        if result['time_to_first_sitemap'] is None and result['sitemap_urls']:
+            result['time_to_first_sitemap'] = elapsed
+        if result['time_to_first_screenshot'] is None and result['screenshots']:
+            result['time_to_first_screenshot'] = elapsed
+        for path in FRAGMENTS:
+            recorder.request(session, 'GET', base_url, path)
+        capture = info.get('capture') or {}
+        result['page_bytes'] = capture.get('mean_page_bytes')
+        result['page_load_ms'] = capture.get('mean_load_ms')
+        result['blocked_requests'] = capture.get('blocked')
+        result['saved_bytes_estimate'] = capture.get('saved_bytes_estimate')
+        result['status'] = info.get('status')
+        if result['status'] in TERMINAL_STATUSES:
+            result['total'] = time.perf_counter() - started
+            return result
+        time.sleep(args.poll_interval)
+    result['status'] = 'timeout'
+    return result
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, port):
+    env = dict(os.environ,
+               CRAWL_MAX_PAGES=str(args.max_pages or args.pages),
+               STORAGE_BACKEND=args.storage,
+               BENCH_S3_LATENCY_MS=str(args.s3_latency_ms),
+               BENCH_LLM_LATENCY_MS=str(args.llm_latency_ms))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'server:app', '--pythonpath', BENCH_DIR,
+         '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers), '--worker-class', 'gthread',
+         '--threads', str(args.threads), '--timeout', '120'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    started = time.perf_counter()
+    while time.perf_counter() - started < BOOT_TIMEOUT:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {server.returncode}")
+        try:
+            requests.get(base_url + '/_bench/stats', timeout=1)
+            return server, base_url
+        except requests.RequestException:
+            time.sleep(0.05)
+    stop_server(server)
+    raise RuntimeError(f"App did not answer within {BOOT_TIMEOUT}s")
+
+
+def stop_server(server):
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load benchmark for Recce")
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--tasks-per-user', type=int, default=1)
+    parser.add_argument('--pages', type=int, default=30, help="pages in the synthetic site")
+    parser.add_argument('--fanout', type=int, default=5, help="links per synthetic page")
+    parser.add_argument('--page-kb', type=int, default=20, help="filler text per page")
+    parser.add_argument('--xhr', type=int, default=3, help="API calls per page")
+    parser.add_argument('--slow-every', type=int, default=0, help="every Nth page calls a slow endpoint")
+    parser.add_argument('--slow-ms', type=int, default=1000)
+    parser.add_argument('--sitemap', action='store_true', help="site publishes robots.txt and sitemaps")
+    parser.add_argument('--assets', action='store_true', help="pages load an image, font and video")
+    parser.add_argument('--max-pages', type=int, help="CRAWL_MAX_PAGES for the app (default: --pages)")
+    parser.add_argument('--depth', type=int, default=10)
+    parser.add_argument('--profile', default='fast', help="capture profile: fast, faithful or api-discovery")
+    parser.add_argument('--concepts', nargs=2, metavar=('CONCEPT1', 'CONCEPT2'))
+    parser.add_argument('--storage', choices=('s3', 'local'), default='s3',
+                        help="artifact storage: the fake S3 or local disk served by the app")
+    parser.add_argument('--s3-latency-ms', type=int, default=50)
+    parser.add_argument('--llm-latency-ms', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--poll-interval', type=float, default=0.25)
+    parser.add_argument('--task-timeout', type=float, default=300)
+    parser.add_argument('--app-url', help="benchmark an already running bench/server.py instead")
+    parser.add_argument('--output', help="results path (default: bench/results/<timestamp>.json)")
+    parser.add_argument('--verbose', action='store_true', help="show the app's log output")
+    args = parser.parse_args()
+
+    site = SyntheticSite(SiteConfig(args.pages, args.fanout, args.page_kb, args.xhr,
+                                    args.slow_every, args.slow_ms, args.sitemap, args.assets)).start()
+    server = None
+    if args.app_url:
+        base_url = args.app_url.rstrip('/')
+    else:
+        server, base_url = start_server(args, free_port())
+
+    recorder = Recorder()
+    sampler = RssSampler(base_url)
+    sampler.sample()
+    sampler.start()
+    task_results = []
+    results_lock = threading.Lock()
+
+    def user():
+        for _ in range(args.tasks_per_user):
+            result = run_task(base_url, site.url, args, recorder)
+            with results_lock:
+                task_results.append(result)
+
+    started = time.perf_counter()
+    try:
+        users = [threading.Thread(target=user, name=f'user-{i}') for i in range(args.users)]
+        for thread in users:
+            thread.start()
+        for thread in users:
+            thread.join()
+        wall_time = time.perf_counter() - started
+        sampler.stop()
+    finally:
+        if server is not None:
+            stop_server(server)
+        site.stop()
+
+    statuses = {}
+    for result in task_results:
+        statuses[result['status']] = statuses.get(result['status'], 0) + 1
+
+    def collect(key):
+        return [result[key] for result in task_results if result[key] is not None]
+
+    results = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'verbose')},
+        'site': site.config.as_dict(),
+        'wall_time_s': round(wall_time, 2),
+        'tasks': {
+            'count': len(task_results),
+            'statuses': statuses,
+            'throughput_per_min': round(len(task_results) / wall_time * 60, 2) if wall_time else None,
+            'time_to_first_sitemap': summarize_ms(collect('time_to_first_sitemap')),
+            'time_to_first_screenshot': summarize_ms(collect('time_to_first_screenshot')),
+            'total': summarize_ms(collect('total')),
+            'sitemap_urls_mean': round(statistics.fmean(collect('sitemap_urls')), 1) if task_results else None,
+            'screenshots_mean': round(statistics.fmean(collect('screenshots')), 1) if task_results else None,
+            'capture': {key: round(statistics.fmean(collect(key)), 1) if collect(key) else None
+                        for key in ('page_bytes', 'page_load_ms', 'blocked_requests', 'saved_bytes_estimate')},
+        },
+        'endpoints': recorder.summary(),
+        'workers': {str(pid): worker for pid, worker in sampler.workers.items()},
+        'fakes': {key: sampler.last[key] for key in ('s3', 'storage', 'openai')} if sampler.last else None,
+    }
+
+    output = args.output or os.path.join(
+        BENCH_DIR, 'results', f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+        f.write('\n')
+    print(json.dumps(results, indent=2))
+    print(f"Saved results to {output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
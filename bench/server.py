@@ -0,0 +1,46 @@
+"""The Recce app with S3, OpenAI and Stripe replaced by local fakes.
+
+Served by the load driver with ``gunicorn --pythonpath bench server:app``.
+Fake latencies come from ``BENCH_S3_LATENCY_MS`` and ``BENCH_LLM_LATENCY_MS``.
+With ``STORAGE_BACKEND=local`` artifacts go to disk instead of the fake S3.
+"""
+import os
+import resource
+
+from flask import jsonify
+
+import app as recce
+from analysis import create_analyzer
+from fakes import FakeOpenAI, FakeS3, FakeStripe
+from storage import S3Storage
+from uploads import UploadQueue
+
+fake_s3 = FakeS3(latency=int(os.getenv('BENCH_S3_LATENCY_MS', 50)) / 1000)
+fake_openai = FakeOpenAI(latency=int(os.getenv('BENCH_LLM_LATENCY_MS', 1000)) / 1000)
+
+if recce.storage.backend == 's3':
+    recce.storage = S3Storage(fake_s3)
+    recce.upload_queue = UploadQueue(recce.storage)
+recce.analyzer = create_analyzer(client=fake_openai)
+recce.stripe_client = lambda: FakeStripe
+
+app = recce.app
+
+
+def current_rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+@app.route('/_bench/stats')
+def bench_stats():
+    return jsonify({
+        'pid': os.getpid(),
+        'rss_bytes': current_rss(),
+        'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        's3': fake_s3.stats(),
+        'storage': recce.storage.stats(),
+        'openai': fake_openai.stats(),
+        'upload_queue_depth': recce.upload_queue.depth(),
+        'browser_pool': recce.browser_pool.stats(),
+    })
@@ -0,0 +1,111 @@
+"""Startup benchmark: app import time and gunicorn worker boot time.
+
+Usage: python bench/startup.py [--runs 5] [--top 15] [--output startup.json]
+
+Each measurement runs in a fresh interpreter. Import time is the wall clock
+of ``import app`` plus a ``-X importtime`` breakdown of the slowest modules.
+Worker boot time is measured from spawning gunicorn (with the Procfile's
+worker class) until ``/stats`` answers.
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_SNIPPET = 'import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)'
+BOOT_TIMEOUT = 60
+
+
+def measure_import():
+    result = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def import_breakdown(top):
+    """Return the ``top`` modules with the largest cumulative import time, in ms."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        modules[name] = max(modules.get(name, 0), int(cumulative) / 1000)
+    slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [{'module': name, 'cumulative_ms': round(ms, 1)} for name, ms in slowest]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def measure_worker_boot():
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}',
+         '--workers', '1', '--worker-class', 'gthread', '--threads', '8'],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < BOOT_TIMEOUT:
+            if server.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with status {server.returncode}")
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/stats', timeout=1):
+                    return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError(f"Worker did not answer within {BOOT_TIMEOUT}s")
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def summarize(samples):
+    return {
+        'runs': len(samples),
+        'min_ms': round(min(samples) * 1000, 1),
+        'median_ms': round(statistics.median(samples) * 1000, 1),
+        'max_ms': round(max(samples) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help="slowest imports to list")
+    parser.add_argument('--skip-boot', action='store_true', help="only measure imports")
+    parser.add_argument('--output', help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = {
+        'python': sys.version.split()[0],
+        'import': summarize([measure_import() for _ in range(args.runs)]),
+        'slowest_imports': import_breakdown(args.top),
+    }
+    if not args.skip_boot:
+        results['worker_boot'] = summarize([measure_worker_boot() for _ in range(args.runs)])
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
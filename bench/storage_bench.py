@@ -0,0 +1,132 @@
+"""Artifact storage benchmark: uploads, URL lookups and local serving, offline.
+
+Usage: python bench/storage_bench.py [--artifacts 200] [--kb 300] [--lookups 20] [--output storage.json]
+
+Uploads go through the app's UploadQueue into the fake S3 (with
+``--s3-latency-ms``) and into a temporary local storage directory. URL
+lookups repeat ``storage.url`` for every artifact with and without the URL
+cache; presigning uses a real boto3 client with dummy credentials, which
+signs locally. Local serving is measured through the Flask test client for
+full, ranged and conditional GETs.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fakes import FakeS3  # noqa: E402
+from storage import LocalStorage, S3Storage, URLCache  # noqa: E402
+from uploads import UploadQueue  # noqa: E402
+
+
+def summarize(samples):
+    return {
+        'count': len(samples),
+        'total_ms': round(sum(samples) * 1000, 1),
+        'mean_us': round(statistics.fmean(samples) * 1e6, 1),
+        'max_us': round(max(samples) * 1e6, 1),
+    }
+
+
+def artifact_keys(count):
+    return [f'bench/screenshots/page_{i}.png' for i in range(count)]
+
+
+def measure_uploads(storage, keys, body):
+    queue = UploadQueue(storage)
+    started = time.perf_counter()
+    futures = [queue.submit(key, body) for key in keys]
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - started
+    return {'seconds': round(elapsed, 3), 'per_second': round(len(keys) / elapsed, 1)}
+
+
+def presigning_client():
+    import boto3
+    return boto3.client('s3', region_name='ca-central-1', aws_access_key_id='bench',
+                        aws_secret_access_key='bench')
+
+
+def measure_lookups(storage, keys, lookups):
+    samples = []
+    for _ in range(lookups):
+        for key in keys:
+            started = time.perf_counter()
+            storage.url(key)
+            samples.append(time.perf_counter() - started)
+    return {**summarize(samples), 'cache': storage.urls.stats()}
+
+
+def measure_serving(storage, keys):
+    os.environ['STORAGE_BACKEND'] = 'local'
+    import app as recce
+    recce.storage = storage
+    client = recce.app.test_client()
+    results = {}
+    requests = {
+        'full': {},
+        'range': {'Range': 'bytes=0-65535'},
+    }
+    for name, headers in requests.items():
+        samples = []
+        for key in keys:
+            started = time.perf_counter()
+            response = client.get(storage.url(key), headers=headers)
+            response.get_data()
+            samples.append(time.perf_counter() - started)
+        results[name] = {**summarize(samples), 'status': response.status_code}
+    etag = client.get(storage.url(keys[0])).headers.get('ETag')
+    samples = []
+    for _ in keys:
+        started = time.perf_counter()
+        response = client.get(storage.url(keys[0]), headers={'If-None-Match': etag})
+        samples.append(time.perf_counter() - started)
+    results['conditional'] = {**summarize(samples), 'status': response.status_code}
+    results['cache_control'] = response.headers.get('Cache-Control')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--artifacts', type=int, default=200)
+    parser.add_argument('--kb', type=int, default=300, help="size of each artifact")
+    parser.add_argument('--lookups', type=int, default=20, help="URL lookups per artifact")
+    parser.add_argument('--s3-latency-ms', type=int, default=50)
+    parser.add_argument('--output', help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    keys = artifact_keys(args.artifacts)
+    body = os.urandom(args.kb * 1024)
+    with tempfile.TemporaryDirectory(prefix='recce-bench-') as root:
+        fake_s3 = FakeS3(latency=args.s3_latency_ms / 1000)
+        local = LocalStorage(root)
+        results = {
+            'config': vars(args),
+            'uploads': {
+                's3': measure_uploads(S3Storage(fake_s3), keys, body),
+                'local': measure_uploads(local, keys, body),
+            },
+            'url_lookups': {
+                'cached': measure_lookups(S3Storage(presigning_client()), keys, args.lookups),
+                'uncached': measure_lookups(S3Storage(presigning_client(), url_cache=URLCache(maxsize=0)),
+                                            keys, args.lookups),
+            },
+            'local_serving': measure_serving(local, keys),
+        }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
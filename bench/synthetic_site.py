@@ -0,0 +1,175 @@
+"""Local synthetic website for benchmarks.
+
+Pages form a tree: page ``n`` links to pages ``n * fanout + 1`` through
+``n * fanout + fanout``, carries ``page_kb`` of filler text and fires
+``xhr`` API calls when loaded. Every ``slow_every``-th page calls a slow
+endpoint that answers after ``slow_ms``. With ``sitemap`` the site also
+publishes robots.txt pointing at a sitemap index with one gzipped sitemap.
+With ``assets`` every page also loads an image, a web font and a video, so
+capture profiles have heavy resources to skip.
+
+Run standalone with ``python bench/synthetic_site.py --pages 50``.
+"""
+import argparse
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILLER = 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. '
+ASSETS = {
+    '/assets/hero.png': ('image/png', 200 * 1024),
+    '/assets/body.woff2': ('font/woff2', 100 * 1024),
+    '/assets/intro.mp4': ('video/mp4', 1024 * 1024),
+}
+ASSET_MARKUP = """<style>@font-face { font-family: Body; src: url(/assets/body.woff2); } body { font-family: Body; }</style>
+<img src="/assets/hero.png" alt="">
+<video src="/assets/intro.mp4" autoplay muted></video>"""
+
+
+class SiteConfig:
+    def __init__(self, pages=50, fanout=5, page_kb=20, xhr=3, slow_every=0, slow_ms=1000, sitemap=False,
+                 assets=False):
+        self.pages = pages
+        self.fanout = fanout
+        self.page_kb = page_kb
+        self.xhr = xhr
+        self.slow_every = slow_every
+        self.slow_ms = slow_ms
+        self.sitemap = sitemap
+        self.assets = assets
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def page_path(n):
+    return '/' if n == 0 else f'/page/{n}'
+
+
+def render_page(config, n):
+    children = [c for c in range(n * config.fanout + 1, n * config.fanout + config.fanout + 1)
+                if c < config.pages]
+    links = ''.join(f'<li><a href="{page_path(c)}">Page {c}</a></li>' for c in children)
+    if n:
+        links += '<li><a href="/">Home</a></li>'
+    calls = [f'/api/items/{n}/{k}' for k in range(config.xhr)]
+    if config.slow_every and n % config.slow_every == 0:
+        calls.append(f'/api/slow/{n}')
+    filler = (FILLER * (config.page_kb * 1024 // len(FILLER) + 1))[:config.page_kb * 1024]
+    return f"""<!DOCTYPE html>
+<html><head><title>Synthetic page {n}</title></head>
+<body>
+<h1>Synthetic page {n}</h1>
+{ASSET_MARKUP if config.assets else ''}
+<ul>{links}</ul>
+<p>{filler}</p>
+<script>{json.dumps(calls)}.forEach(url => fetch(url));</script>
+</body></html>"""
+
+
+def render_sitemap(base_url, config):
+    urls = ''.join(f'<url><loc>{base_url}{page_path(n)}</loc></url>' for n in range(config.pages))
+    xml = f'<?xml version="1.0" encoding="UTF-8"?>' \
+          f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'
+    return gzip.compress(xml.encode())
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_HEAD(self):
+            self._respond(head=True)
+
+        def do_GET(self):
+            self._respond()
+
+        def _respond(self, head=False):
+            path = self.path.split('?')[0]
+            parts = path.strip('/').split('/')
+            base_url = f'http://{self.headers.get("Host")}'
+            if config.sitemap and path == '/robots.txt':
+                self._send(200, 'text/plain', f'User-agent: *\nSitemap: {base_url}/sitemap_index.xml\n', head)
+            elif config.sitemap and path == '/sitemap_index.xml':
+                body = ('<?xml version="1.0" encoding="UTF-8"?>'
+                        '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                        f'<sitemap><loc>{base_url}/sitemap-1.xml.gz</loc></sitemap></sitemapindex>')
+                self._send(200, 'application/xml', body, head)
+            elif config.sitemap and path == '/sitemap-1.xml.gz':
+                self._send(200, 'application/gzip', render_sitemap(base_url, config), head)
+            elif config.assets and path in ASSETS:
+                content_type, size = ASSETS[path]
+                self._send(200, content_type, bytes(size), head)
+            elif path == '/' or (parts[0] == 'page' and len(parts) == 2 and parts[1].isdigit()
+                               and int(parts[1]) < config.pages):
+                n = 0 if path == '/' else int(parts[1])
+                self._send(200, 'text/html; charset=utf-8', render_page(config, n), head)
+            elif parts[0] == 'api' and len(parts) >= 3:
+                if parts[1] == 'slow':
+                    time.sleep(config.slow_ms / 1000)
+                body = json.dumps({'path': path, 'items': list(range(10))})
+                self._send(200, 'application/json', body, head)
+            else:
+                self._send(404, 'text/plain', 'Not found', head)
+
+        def _send(self, status, content_type, body, head):
+            data = body if isinstance(body, bytes) else body.encode()
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            if not head:
+                self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class SyntheticSite:
+    """Synthetic site served from a background thread on ``127.0.0.1``."""
+
+    def __init__(self, config=None, port=0):
+        self.config = config or SiteConfig()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(self.config))
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='synthetic-site', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic website for benchmarks")
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--fanout', type=int, default=5)
+    parser.add_argument('--page-kb', type=int, default=20)
+    parser.add_argument('--xhr', type=int, default=3)
+    parser.add_argument('--slow-every', type=int, default=0)
+    parser.add_argument('--slow-ms', type=int, default=1000)
+    parser.add_argument('--sitemap', action='store_true', help="publish robots.txt and a sitemap index")
+    parser.add_argument('--assets', action='store_true', help="load an image, font and video on every page")
+    args = parser.parse_args()
+    config = SiteConfig(args.pages, args.fanout, args.page_kb, args.xhr, args.slow_every, args.slow_ms,
+                        args.sitemap, args.assets)
+    site = SyntheticSite(config, port=args.port)
+    print(f"Serving {config.pages} pages at {site.url}")
+    site.server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""Long-lived pool of Chromium processes shared by capture tasks.
+
+Playwright objects are bound to the event loop that created them, so the pool
+runs its own loop on a background thread and every browser lives there.
+Tasks lease an isolated browser context with :meth:`BrowserPool.run`, which
+executes a coroutine function on the pool loop and blocks until it finishes.
+"""
+import asyncio
+import logging
+import os
+import threading
+from contextlib import asynccontextmanager
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv('BROWSER_POOL_SIZE', 2))
+CONTEXTS_PER_BROWSER = int(os.getenv('BROWSER_CONTEXTS_PER_BROWSER', 4))
+RECYCLE_AFTER = int(os.getenv('BROWSER_RECYCLE_AFTER', 50))
+HEALTH_CHECK_INTERVAL = float(os.getenv('BROWSER_HEALTH_CHECK_INTERVAL', 30))
+
+
+class _PooledBrowser:
+    def __init__(self, browser):
+        self.browser = browser
+        self.active = 0
+        self.uses = 0
+        self.retiring = False
+
+    @property
+    def healthy(self):
+        return self.browser.is_connected()
+
+
+class BrowserPool:
+    """Bounded set of Chromium processes handing out isolated contexts.
+
+    At most ``size`` browsers run at once and each serves at most
+    ``contexts_per_browser`` concurrent contexts. A browser is retired once it
+    has served ``recycle_after`` contexts, and crashed browsers are replaced by
+    a periodic health check.
+    """
+
+    def __init__(self, size=POOL_SIZE, contexts_per_browser=CONTEXTS_PER_BROWSER,
+                 recycle_after=RECYCLE_AFTER, health_check_interval=HEALTH_CHECK_INTERVAL,
+                 launch_options=None):
+        self.size = size
+        self.contexts_per_browser = contexts_per_browser
+        self.recycle_after = recycle_after
+        self.health_check_interval = health_check_interval
+        self.launch_options = launch_options or {'headless': True}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self._loop = None
+        self._startup_error = None
+        self._playwright = None
+        self._condition = None
+        self._health_task = None
+        self._browsers = []
+        self._launching = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._ready.clear()
+                self._startup_error = None
+                self._thread = threading.Thread(target=self._run, name='browser-pool', daemon=True)
+                self._thread.start()
+        self._ready.wait()
+        if self._startup_error:
+            with self._lock:
+                self._thread = None
+            raise self._startup_error
+
+    def run(self, fn, **context_options):
+        """Run ``await fn(context)`` in a leased context and return its result."""
+        return self.submit(fn, **context_options).result()
+
+    def submit(self, fn, **context_options):
+        self.start()
+
+        async def runner():
+            async with self.context(**context_options) as context:
+                return await fn(context)
+
+        return asyncio.run_coroutine_threadsafe(runner(), self._loop)
+
+    def shutdown(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None or self._loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=30)
+        except Exception as e:
+            logger.warning(f"Error shutting down browser pool: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        thread.join(timeout=5)
+
+    def stats(self):
+        browsers = list(self._browsers)
+        return {
+            'browsers': len(browsers),
+            'active_contexts': sum(b.active for b in browsers),
+            'launching': self._launching,
+        }
+
+    @asynccontextmanager
+    async def context(self, **options):
+        with span('browser.acquire'):
+            pooled = await self._acquire()
+        context = None
+        try:
+            with span('browser.new_context'):
+                context = await pooled.browser.new_context(**options)
+            yield context
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception as e:
+                    logger.warning(f"Failed to close browser context: {e}")
+            await self._release(pooled)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._startup())
+        except Exception as e:
+            logger.error(f"Failed to start browser pool: {e}")
+            self._startup_error = e
+            self._ready.set()
+            self._loop.close()
+            return
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    async def _startup(self):
+        # Playwright is imported with the pool rather than the app; it is slow to import
+        from playwright.async_api import async_playwright
+        self._playwright = await async_playwright().start()
+        self._condition = asyncio.Condition()
+        # Keep one browser warm so the first task only pays for a new context
+        self._browsers.append(_PooledBrowser(await self._launch()))
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _shutdown(self):
+        if self._health_task:
+            self._health_task.cancel()
+        browsers, self._browsers = self._browsers, []
+        for pooled in browsers:
+            await self._close_browser(pooled)
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def _launch(self):
+        browser = await self._playwright.chromium.launch(**self.launch_options)
+        browser.on('disconnected', lambda _: asyncio.ensure_future(self._notify()))
+        logger.info("Launched pooled browser")
+        return browser
+
+    async def _close_browser(self, pooled):
+        try:
+            if pooled.healthy:
+                await pooled.browser.close()
+        except Exception as e:
+            logger.warning(f"Failed to close pooled browser: {e}")
+
+    async def _notify(self):
+        async with self._condition:
+            self._condition.notify_all()
+
+    async def _acquire(self):
+        async with self._condition:
+            while True:
+                self._prune()
+                available = [b for b in self._browsers
+                             if b.healthy and not b.retiring and b.active < self.contexts_per_browser]
+                if available:
+                    return self._checkout(min(available, key=lambda b: b.active))
+                if len(self._browsers) + self._launching < self.size:
+                    self._launching += 1
+                    break
+                await self._condition.wait()
+
+        try:
+            browser = await self._launch()
+        except Exception:
+            async with self._condition:
+                self._launching -= 1
+                self._condition.notify_all()
+            raise
+        async with self._condition:
+            self._launching -= 1
+            pooled = _PooledBrowser(browser)
+            self._browsers.append(pooled)
+            return self._checkout(pooled)
+
+    def _checkout(self, pooled):
+        pooled.active += 1
+        pooled.uses += 1
+        if pooled.uses >= self.recycle_after:
+            pooled.retiring = True
+        return pooled
+
+    async def _release(self, pooled):
+        async with self._condition:
+            pooled.active -= 1
+            retire = pooled.active == 0 and (pooled.retiring or not pooled.healthy)
+            if retire and pooled in self._browsers:
+                self._browsers.remove(pooled)
+            self._condition.notify_all()
+        if retire:
+            logger.info(f"Recycling pooled browser after {pooled.uses} contexts")
+            await self._close_browser(pooled)
+
+    def _prune(self):
+        # Idle crashed browsers are dropped; busy ones are dropped on release
+        dead = [b for b in self._browsers if not b.healthy and b.active == 0]
+        for pooled in dead:
+            self._browsers.remove(pooled)
+        return len(dead)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            try:
+                async with self._condition:
+                    crashed = self._prune()
+                if crashed:
+                    logger.warning(f"Replacing {crashed} crashed browser(s) in the pool")
+                for _ in range(crashed):
+                    pooled = _PooledBrowser(await self._launch())
+                    async with self._condition:
+                        if len(self._browsers) + self._launching < self.size:
+                            self._browsers.append(pooled)
+                            self._condition.notify_all()
+                            continue
+                    await self._close_browser(pooled)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Browser pool health check failed: {e}")
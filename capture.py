@@ -0,0 +1,134 @@
+"""Concurrent page capture within a leased browser context."""
+import asyncio
+import logging
+import os
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+PAGE_CONCURRENCY = int(os.getenv('CAPTURE_PAGE_CONCURRENCY', 4))
+PAGE_DEADLINE = float(os.getenv('CAPTURE_PAGE_DEADLINE', 15))
+NAVIGATION_TIMEOUT = int(os.getenv('CAPTURE_NAVIGATION_TIMEOUT', 30000))
+MAX_PAGE_HEIGHT = int(os.getenv('CAPTURE_MAX_PAGE_HEIGHT', 20000))
+TILE_HEIGHT = int(os.getenv('CAPTURE_TILE_HEIGHT', 2000))
+# Only pages taller than this are tiled; shorter ones stay a single full-page capture
+TILE_THRESHOLD = max(TILE_HEIGHT, int(os.getenv('CAPTURE_TILE_THRESHOLD', 8000)))
+POLL_INTERVAL = 0.25
+NETWORK_QUIET = 0.5
+
+# Scrolls one viewport further to trigger lazy loading and reports layout state.
+# Nothing below maxHeight is captured, so infinite scroll stops growing there.
+READINESS_SCRIPT = """maxHeight => {
+    const root = document.scrollingElement || document.documentElement;
+    const height = Math.min(root.scrollHeight, maxHeight);
+    if (window.scrollY + window.innerHeight < height) {
+        window.scrollBy(0, window.innerHeight);
+    }
+    const pending = Array.from(document.images).filter(img => !img.complete).length;
+    return {
+        height: height,
+        atBottom: window.scrollY + window.innerHeight >= height - 2,
+        pending: pending,
+    };
+}"""
+PAGE_HEIGHT_SCRIPT = '() => (document.scrollingElement || document.documentElement).scrollHeight'
+
+
+class NetworkTracker:
+    """Counts in-flight requests for a page to detect when its network settles."""
+
+    def __init__(self, page):
+        self._loop = asyncio.get_running_loop()
+        self.inflight = 0
+        self.last_activity = self._loop.time()
+        page.on('request', self._started)
+        page.on('requestfinished', self._finished)
+        page.on('requestfailed', self._finished)
+
+    def _started(self, request):
+        self.inflight += 1
+        self.last_activity = self._loop.time()
+
+    def _finished(self, request):
+        self.inflight = max(0, self.inflight - 1)
+        self.last_activity = self._loop.time()
+
+    @property
+    def quiet(self):
+        return self.inflight == 0 and self._loop.time() - self.last_activity >= NETWORK_QUIET
+
+
+async def wait_until_ready(page, network, deadline=PAGE_DEADLINE):
+    """Wait until the DOM, lazy-loaded images and network have settled.
+
+    Returns ``True`` when the page settled and ``False`` when ``deadline``
+    seconds passed first; either way the page is scrolled back to the top.
+    """
+    loop = asyncio.get_running_loop()
+    end = loop.time() + deadline
+    last_height = None
+    ready = False
+    while loop.time() < end:
+        state = await page.evaluate(READINESS_SCRIPT, MAX_PAGE_HEIGHT)
+        stable = state['height'] == last_height
+        if stable and state['atBottom'] and not state['pending'] and network.quiet:
+            ready = True
+            break
+        last_height = state['height']
+        await asyncio.sleep(POLL_INTERVAL)
+    await page.evaluate('window.scrollTo(0, 0)')
+    return ready
+
+
+async def page_height(page):
+    return await page.evaluate(PAGE_HEIGHT_SCRIPT)
+
+
+async def iter_tiles(page, height, tile_height=TILE_HEIGHT, **screenshot_options):
+    """Yield ``(y, tile_height, png)`` slices of the top ``height`` CSS pixels of ``page``.
+
+    Each slice is rendered on its own with a clipped screenshot, so neither
+    Chromium nor this process ever holds a bitmap of the whole page.
+    """
+    width = page.viewport_size['width']
+    for y in range(0, height, tile_height):
+        clip = {'x': 0, 'y': y, 'width': width, 'height': min(tile_height, height - y)}
+        with span('capture.tile'):
+            png = await page.screenshot(clip=clip, full_page=True, **screenshot_options)
+        yield y, clip['height'], png
+
+
+async def capture_pages(context, urls, handle_page, concurrency=PAGE_CONCURRENCY, deadline=PAGE_DEADLINE,
+                        profile=None, stats=None):
+    """Load ``urls`` in up to ``concurrency`` pages and call ``handle_page`` on each.
+
+    ``handle_page(page, idx, url)`` is awaited once the page is ready; failures
+    are logged per page and do not stop the other pages. With a capture
+    ``profile`` (see :mod:`profiles`) each page's requests are routed through
+    it and its load time and bytes are added to ``stats``.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def capture_one(idx, url):
+        async with semaphore:
+            with span('capture.new_page'):
+                page = await context.new_page()
+            try:
+                network = NetworkTracker(page)
+                load = await profile.attach(page, url, stats) if profile else None
+                with span('capture.goto'):
+                    await page.goto(url, wait_until='domcontentloaded', timeout=NAVIGATION_TIMEOUT)
+                with span('capture.ready'):
+                    ready = await wait_until_ready(page, network, deadline)
+                if load:
+                    load.finish()
+                if not ready:
+                    logger.info(f"Page {url} did not settle within {deadline}s, capturing anyway")
+                await handle_page(page, idx, url)
+            except Exception as e:
+                logger.warning(f"Failed to capture screenshot for {url}: {e}")
+            finally:
+                await page.close()
+
+    await asyncio.gather(*(capture_one(idx, url) for idx, url in enumerate(urls)))
@@ -0,0 +1,106 @@
+"""Cross-task cache of crawled pages for conditional revalidation."""
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+CRAWL_CACHE_MAX_BYTES = int(os.getenv('CRAWL_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+REACHABLE_TTL = int(os.getenv('CRAWL_CACHE_REACHABLE_TTL', 300))
+MAX_REACHABLE_URLS = 10000
+
+
+class CacheEntry:
+    __slots__ = ('etag', 'last_modified', 'body_hash', 'links', 'fetched_at', 'size')
+
+    def __init__(self, etag, last_modified, body_hash, links):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body_hash = body_hash
+        self.links = tuple(links)
+        self.fetched_at = time.time()
+        self.size = 256 + sum(sys.getsizeof(link) for link in self.links)
+
+    def validators(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class CrawlCache:
+    """Page validators, body hashes and extracted links shared by every crawl.
+
+    Entries are keyed by URL and evicted least recently used first once their
+    estimated size exceeds ``max_bytes``. The cache also remembers which URLs
+    answered recently, so reachability probes can skip the network.
+    """
+
+    def __init__(self, max_bytes=CRAWL_CACHE_MAX_BYTES, reachable_ttl=REACHABLE_TTL):
+        self.max_bytes = max_bytes
+        self.reachable_ttl = reachable_ttl
+        self.size = 0
+        self._entries = OrderedDict()
+        self._reachable = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'unchanged': 0,
+                       'probe_hits': 0, 'probe_misses': 0, 'evictions': 0}
+
+    def get(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+
+    def put(self, url, etag, last_modified, body_hash, links):
+        entry = CacheEntry(etag, last_modified, body_hash, links)
+        with self._lock:
+            self._stats['misses'] += 1
+            old = self._entries.pop(url, None)
+            if old is not None:
+                self.size -= old.size
+            self._entries[url] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.size
+                self._stats['evictions'] += 1
+            self._mark_reachable(url)
+        return entry
+
+    def revalidated(self, url, entry, reason):
+        """Record that ``entry`` is still current, via a 304 or an unchanged body hash."""
+        with self._lock:
+            entry.fetched_at = time.time()
+            self._stats['hits'] += 1
+            self._stats[reason] += 1
+            self._mark_reachable(url)
+
+    def is_reachable(self, url):
+        with self._lock:
+            checked_at = self._reachable.get(url)
+            fresh = checked_at is not None and time.time() - checked_at < self.reachable_ttl
+            self._stats['probe_hits' if fresh else 'probe_misses'] += 1
+            return fresh
+
+    def mark_reachable(self, url):
+        with self._lock:
+            self._mark_reachable(url)
+
+    def _mark_reachable(self, url):
+        self._reachable[url] = time.time()
+        self._reachable.move_to_end(url)
+        while len(self._reachable) > MAX_REACHABLE_URLS:
+            self._reachable.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self.size
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
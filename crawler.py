@@ -0,0 +1,200 @@
+"""Concurrent breadth-first crawler used to build task sitemaps."""
+import asyncio
+import hashlib
+import itertools
+import logging
+import os
+from collections import defaultdict
+from contextlib import aclosing
+from urllib.parse import urldefrag, urljoin, urlparse
+
+from metrics import span
+from sitemaps import RobotsRules, fetch_robots, iter_sitemap_urls
+
+logger = logging.getLogger(__name__)
+
+MAX_PAGES = int(os.getenv('CRAWL_MAX_PAGES', 10))
+MAX_DEPTH = int(os.getenv('CRAWL_MAX_DEPTH', 10))
+MAX_CONCURRENCY = int(os.getenv('CRAWL_CONCURRENCY', 16))
+PER_HOST_CONCURRENCY = int(os.getenv('CRAWL_PER_HOST_CONCURRENCY', 4))
+REQUEST_TIMEOUT = float(os.getenv('CRAWL_TIMEOUT', 10))
+USER_AGENT = 'Mozilla/5.0 (compatible; Recce/0.0.4)'
+ROBOTS_AGENT = 'recce'
+USE_SITEMAPS = os.getenv('CRAWL_USE_SITEMAPS', '1') == '1'
+
+
+def extract_links(html, page_url):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    links = []
+    for link in soup.find_all('a', href=True):
+        href, _ = urldefrag(urljoin(page_url, link['href']))
+        if href.startswith(('http://', 'https://')):
+            links.append(href)
+    return links
+
+
+def path_depth(url, start_url):
+    """Depth of ``url`` below ``start_url`` by path segments, at least 1 for any other page."""
+    def segments(u):
+        return len([part for part in urlparse(u).path.split('/') if part])
+    return max(1, segments(url) - segments(start_url))
+
+
+class Crawler:
+    """Crawl a single site breadth-first over a pooled keep-alive client.
+
+    Pages are fetched by ``max_concurrency`` workers sharing one connection
+    pool, with at most ``per_host_concurrency`` requests in flight per host.
+    The crawl stops discovering URLs once ``max_pages`` are in the sitemap
+    and never follows links from pages deeper than ``max_depth``.
+    ``on_url`` is called with each URL as soon as it joins the sitemap.
+
+    With a shared ``cache``, pages fetched before are requested conditionally
+    and a 304 or an unchanged body reuses the cached links without parsing.
+    Once the ``cancelled`` event is set, queued pages are dropped unfetched.
+
+    robots.txt is read first: disallowed pages are never fetched or listed
+    and its Crawl-delay spaces out requests. With ``use_sitemaps``, pages
+    listed in the site's sitemaps are added before any HTML is fetched, so
+    link discovery only fills what the sitemaps miss. A listed page's depth
+    is its path depth below the start URL (see :func:`path_depth`), and
+    pages deeper than ``max_depth`` are left out.
+    """
+
+    def __init__(self, max_pages=MAX_PAGES, max_depth=MAX_DEPTH, max_concurrency=MAX_CONCURRENCY,
+                 per_host_concurrency=PER_HOST_CONCURRENCY, timeout=REQUEST_TIMEOUT, on_url=None,
+                 cache=None, cancelled=None, use_sitemaps=USE_SITEMAPS):
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.max_concurrency = max_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.timeout = timeout
+        self.on_url = on_url
+        self.cache = cache
+        self.cancelled = cancelled
+        self.use_sitemaps = use_sitemaps
+        self._robots = RobotsRules()
+        self._delay_lock = None
+        self._next_fetch = 0.0
+
+    async def crawl(self, start_url):
+        import httpx  # Deferred so importing the app does not pay for the HTTP stack
+        base_url = '{uri.scheme}://{uri.netloc}'.format(uri=urlparse(start_url))
+        sitemap = []
+        seen = {start_url}
+        self._add(sitemap, start_url)
+        # Ordered by (depth, discovery order) so shallower pages always go first
+        queue = asyncio.PriorityQueue()
+        counter = itertools.count()
+        queue.put_nowait((0, next(counter), start_url))
+        host_limits = defaultdict(lambda: asyncio.Semaphore(self.per_host_concurrency))
+
+        limits = httpx.Limits(max_connections=self.max_concurrency,
+                              max_keepalive_connections=self.max_concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=self.timeout, follow_redirects=True,
+                                     headers={'User-Agent': USER_AGENT}) as client:
+            self._robots = await fetch_robots(client, base_url, ROBOTS_AGENT)
+            self._delay_lock = asyncio.Lock()
+            if self.use_sitemaps:
+                await self._seed_from_sitemaps(client, start_url, base_url, sitemap, seen, queue, counter)
+
+            async def worker():
+                while True:
+                    depth, _, url = await queue.get()
+                    try:
+                        if self._is_cancelled() or not self._robots.allowed(url):
+                            continue
+                        # Fetching only discovers links, so skip it when none could be kept
+                        if len(sitemap) >= self.max_pages or depth >= self.max_depth:
+                            continue
+                        links = await self._fetch_links(client, host_limits, url, base_url)
+                        for href in links:
+                            if len(sitemap) >= self.max_pages:
+                                break
+                            if href in seen or not href.startswith(base_url) or not self._robots.allowed(href):
+                                continue
+                            seen.add(href)
+                            self._add(sitemap, href)
+                            if depth + 1 < self.max_depth:
+                                queue.put_nowait((depth + 1, next(counter), href))
+                    finally:
+                        queue.task_done()
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.max_concurrency)]
+            try:
+                await queue.join()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+        return sitemap
+
+    async def _seed_from_sitemaps(self, client, start_url, base_url, sitemap, seen, queue, counter):
+        sitemap_urls = self._robots.sitemaps or [urljoin(base_url, '/sitemap.xml')]
+        async with aclosing(iter_sitemap_urls(client, sitemap_urls)) as locations:
+            async for location in locations:
+                if len(sitemap) >= self.max_pages or self._is_cancelled():
+                    break
+                href, _ = urldefrag(location)
+                if href in seen or not href.startswith(base_url) or not self._robots.allowed(href):
+                    continue
+                # Sitemaps list the whole site, so their depth comes from the URL path
+                depth = path_depth(href, start_url)
+                if depth > self.max_depth:
+                    continue
+                seen.add(href)
+                self._add(sitemap, href)
+                # Listed pages are still crawled for links if the budget is not yet filled
+                if depth < self.max_depth:
+                    queue.put_nowait((depth, next(counter), href))
+
+    def _is_cancelled(self):
+        return self.cancelled is not None and self.cancelled.is_set()
+
+    async def _throttle(self):
+        # Space requests at least Crawl-delay seconds apart
+        async with self._delay_lock:
+            loop = asyncio.get_running_loop()
+            wait = self._next_fetch - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_fetch = loop.time() + self._robots.crawl_delay
+
+    def _add(self, sitemap, url):
+        sitemap.append(url)
+        if self.on_url:
+            self.on_url(url)
+
+    async def _fetch_links(self, client, host_limits, url, base_url):
+        try:
+            entry = self.cache.get(url) if self.cache else None
+            headers = entry.validators() if entry else None
+            async with host_limits[urlparse(url).netloc]:
+                if self._robots.crawl_delay:
+                    await self._throttle()
+                with span('crawl.fetch'):
+                    response = await client.get(url, headers=headers)
+            if entry and response.status_code == 304:
+                self.cache.revalidated(url, entry, 'not_modified')
+                return entry.links
+            if 'html' not in response.headers.get('content-type', 'text/html'):
+                return []
+            body_hash = hashlib.sha1(response.content).hexdigest()
+            if entry and entry.body_hash == body_hash:
+                self.cache.revalidated(url, entry, 'unchanged')
+                return entry.links
+            with span('crawl.parse'):
+                links = await asyncio.to_thread(extract_links, response.text, str(response.url))
+            if self.cache and response.is_success:
+                self.cache.put(url, response.headers.get('etag'), response.headers.get('last-modified'),
+                               body_hash, links)
+            return links
+        except Exception as e:
+            logger.warning(f"Error crawling {url}: {e}")
+            return []
+
+
+def crawl(start_url, **kwargs):
+    return asyncio.run(Crawler(**kwargs).crawl(start_url))
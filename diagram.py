@@ -0,0 +1,185 @@
+"""System diagram construction and a content-addressed SVG render cache."""
+import hashlib
+import importlib.util
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+DIAGRAM_CACHE_SIZE = int(os.getenv('DIAGRAM_CACHE_SIZE', 256))
+DIAGRAM_CACHE_DIR = os.getenv('DIAGRAM_CACHE_DIR')
+DIAGRAM_MAX_RENDERS = int(os.getenv('DIAGRAM_MAX_RENDERS', 2))
+
+_graphviz_available = importlib.util.find_spec('graphviz') is not None
+if not _graphviz_available:
+    print("Warning: graphviz package not available")
+
+
+def graphviz_available():
+    return _graphviz_available
+
+
+def _digraph():
+    # Imported on the first diagram rather than at worker boot
+    import graphviz
+    return graphviz.Digraph(format='svg')
+
+
+def build_default_diagram():
+    # Default diagram showing the site analysis system
+    dot = _digraph()
+    dot.attr(rankdir='LR')
+    dot.attr(size='8,8!')  # Force diagram size
+    dot.attr(ratio='fill')  # Fill available space
+    dot.node('Browser', 'Browser\n(Screenshots + API Calls)')
+    dot.node('Flask', 'Flask Server\n(URL Processing)')
+    dot.node('S3', 'AWS S3\n(Image Storage)')
+    dot.node('OpenAI', 'OpenAI API\n(Systems Analysis)')
+
+    # Show data flow with compact spacing
+    dot.edge('Browser', 'Flask', 'URL Analysis Request')
+    dot.edge('Flask', 'Browser', 'Sitemap Data')
+    dot.edge('Flask', 'S3', 'Store Screenshots')
+    dot.edge('S3', 'Browser', 'Load Images')
+    dot.edge('Flask', 'OpenAI', 'System Analysis')
+    dot.edge('OpenAI', 'Browser', 'System Insights')
+    return dot
+
+
+def build_concept_diagram(concept1, concept2, relationships):
+    dot = _digraph()
+    dot.attr(rankdir='LR')
+    dot.node(concept1, concept1)
+    dot.node(concept2, concept2)
+    for rel in relationships:
+        dot.edge(concept1, concept2, rel)
+    return dot
+
+
+class DiagramRenderer:
+    """Renders Graphviz diagrams to SVG, caching output by a hash of the DOT source.
+
+    Rendered SVGs live in an in-memory LRU and, when ``cache_dir`` is set, on
+    disk so they survive restarts and are shared between workers. At most
+    ``max_renders`` ``dot`` processes run at once, and concurrent requests for
+    the same source wait for a single render.
+    """
+
+    def __init__(self, max_entries=DIAGRAM_CACHE_SIZE, cache_dir=DIAGRAM_CACHE_DIR,
+                 max_renders=DIAGRAM_MAX_RENDERS):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._renders = threading.BoundedSemaphore(max_renders)
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'renders': 0, 'errors': 0}
+
+    @staticmethod
+    def cache_key(dot):
+        return hashlib.sha256(f'{dot.engine}:{dot.format}:{dot.source}'.encode()).hexdigest()
+
+    def render(self, dot):
+        key = self.cache_key(dot)
+        svg = self._get(key)
+        if svg is not None:
+            return svg
+
+        with self._lock:
+            done = self._inflight.get(key)
+            leader = done is None
+            if leader:
+                done = self._inflight[key] = threading.Event()
+        if not leader:
+            done.wait()
+            svg = self._get(key)
+            if svg is None:
+                raise RuntimeError("Concurrent diagram render failed")
+            return svg
+
+        try:
+            with self._renders, span('diagram.render'):
+                svg = dot.pipe().decode('utf-8')
+            with self._lock:
+                self._stats['renders'] += 1
+            self._remember(key, svg)
+            self._write_disk(key, svg)
+            return svg
+        except Exception:
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            done.set()
+
+    def warm(self, build):
+        """Render ``build()`` in the background so the first request hits the cache."""
+        def run():
+            try:
+                self.render(build())
+            except Exception as e:
+                logger.warning(f"Failed to pre-render diagram: {e}")
+
+        thread = threading.Thread(target=run, name='diagram-warmup', daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['renders']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _get(self, key):
+        with self._lock:
+            svg = self._entries.get(key)
+            if svg is not None:
+                self._entries.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return svg
+        svg = self._read_disk(key)
+        if svg is not None:
+            self._remember(key, svg)
+            with self._lock:
+                self._stats['disk_hits'] += 1
+        return svg
+
+    def _remember(self, key, svg):
+        with self._lock:
+            self._entries[key] = svg
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.svg')
+
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key, svg):
+        if not self.cache_dir:
+            return
+        tmp_path = f'{self._path(key)}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(svg)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logger.warning(f"Failed to write diagram cache entry: {e}")
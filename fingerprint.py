@@ -0,0 +1,150 @@
+"""Page fingerprints used to skip capturing and uploading duplicate screenshots."""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+FINGERPRINT_TTL = int(os.getenv('FINGERPRINT_TTL', 12 * 3600))  # Must stay below presigned URL expiry
+MAX_FINGERPRINTS_PER_SITE = int(os.getenv('FINGERPRINT_MAX_PER_SITE', 1000))
+MAX_FINGERPRINT_SITES = int(os.getenv('FINGERPRINT_MAX_SITES', 500))
+TRACKING_PREFIXES = ('utm_',)
+TRACKING_PARAMS = {'gclid', 'fbclid', 'msclkid', 'mc_cid', 'mc_eid', '_ga', '_gl'}
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Visible text plus image sources; enough to tell templated pages apart
+DOM_FINGERPRINT_SCRIPT = """() => ({
+    title: document.title,
+    text: document.body ? document.body.innerText : '',
+    images: Array.from(document.images, img => img.currentSrc || img.src),
+})"""
+
+
+def normalize_url(url):
+    """Canonical form of ``url`` for duplicate detection.
+
+    Lowercases the scheme and host, drops default ports, fragments and
+    tracking parameters, sorts the query and strips trailing slashes, so
+    ``/page``, ``/page/`` and ``/page?utm_source=x`` compare equal.
+    """
+    parsed = urlparse(url)
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or '').lower()
+    if parsed.port and parsed.port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parsed.port}'
+    path = parsed.path.rstrip('/') or '/'
+    query = sorted((k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+                   if not k.lower().startswith(TRACKING_PREFIXES) and k.lower() not in TRACKING_PARAMS)
+    return urlunparse((scheme, host, path, '', urlencode(query), ''))
+
+
+def site_key(url):
+    return urlparse(normalize_url(url)).netloc
+
+
+async def dom_fingerprint(page):
+    content = await page.evaluate(DOM_FINGERPRINT_SCRIPT)
+    normalized = {
+        'title': ' '.join(content['title'].split()),
+        'text': ' '.join(content['text'].split()),
+        'images': sorted(set(content['images'])),
+    }
+    return 'dom:' + hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+
+def image_fingerprint(png_bytes):
+    """Hash of a screenshot's exact bytes.
+
+    Only byte-identical screenshots share it: a small perceptual hash also
+    matches different pages of one tall template, which would show the wrong
+    screenshot instead of uploading the right one.
+    """
+    return 'img:' + hashlib.sha256(png_bytes).hexdigest()
+
+
+class FingerprintIndex:
+    """Per-site map from page fingerprints to uploaded screenshot artifacts.
+
+    The index is shared by every task in the worker, so a re-run of the same
+    site references earlier artifacts. :meth:`reserve` hands the first caller
+    for a fingerprint ownership of the capture; later callers get the same
+    future and wait for the owner's artifact instead of capturing again.
+    The future is shared, so waiters must not cancel it (see ``asyncio.shield``).
+    """
+
+    def __init__(self, ttl=FINGERPRINT_TTL, max_per_site=MAX_FINGERPRINTS_PER_SITE,
+                 max_sites=MAX_FINGERPRINT_SITES):
+        self.ttl = ttl
+        self.max_per_site = max_per_site
+        self.max_sites = max_sites
+        self._sites = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def reserve(self, site, fingerprint):
+        """Return ``(future, owner)``; the future resolves to an artifact dict or None."""
+        with self._lock:
+            entries = self._site(site)
+            entry = entries.get(fingerprint)
+            # A cancelled future never carries an artifact, so it counts as missing
+            if entry is not None and entry[1] > time.monotonic() and not entry[0].cancelled():
+                entries.move_to_end(fingerprint)
+                self._stats['hits'] += 1
+                return entry[0], False
+            self._stats['misses'] += 1
+            future = Future()
+            self._store(entries, fingerprint, future)
+            return future, True
+
+    def lookup(self, site, fingerprint):
+        """Return the artifact already stored for ``fingerprint``, if any."""
+        with self._lock:
+            entry = self._site(site).get(fingerprint)
+            if (entry is None or entry[1] <= time.monotonic() or not entry[0].done()
+                    or entry[0].cancelled()):
+                return None
+            self._stats['hits'] += 1
+            return entry[0].result()
+
+    def resolve(self, site, fingerprints, artifact):
+        """Point ``fingerprints`` at ``artifact``, or forget them when it is None."""
+        with self._lock:
+            entries = self._site(site)
+            for fingerprint in fingerprints:
+                if not fingerprint:
+                    continue
+                entry = entries.get(fingerprint)
+                future = entry[0] if entry is not None and not entry[0].done() else Future()
+                if artifact is None:
+                    entries.pop(fingerprint, None)
+                else:
+                    self._store(entries, fingerprint, future)
+                if not future.done():
+                    future.set_result(artifact)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['sites'] = len(self._sites)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def _site(self, site):
+        entries = self._sites.get(site)
+        if entries is None:
+            entries = self._sites[site] = OrderedDict()
+            while len(self._sites) > self.max_sites:
+                self._sites.popitem(last=False)
+        else:
+            self._sites.move_to_end(site)
+        return entries
+
+    def _store(self, entries, fingerprint, future):
+        entries[fingerprint] = (future, time.monotonic() + self.ttl)
+        entries.move_to_end(fingerprint)
+        while len(entries) > self.max_per_site:
+            entries.popitem(last=False)
@@ -0,0 +1,245 @@
+"""Stage timing spans, Prometheus histograms and per-task timelines.
+
+Wrap a stage in ``with span('capture.goto'):`` to observe its duration in
+the ``recce_stage_seconds`` histogram and, when a task is bound to the
+current context with :func:`bind_task`, in that task's timeline. Context
+variables follow asyncio tasks, ``asyncio.to_thread`` and upload jobs, so
+deeper code does not need the task id passed in.
+"""
+import bisect
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+MAX_TIMELINES = int(os.getenv('METRICS_MAX_TIMELINES', 256))
+
+_current_task = contextvars.ContextVar('recce_task_id', default=None)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for key, counts, total, count in sorted(series):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(key + (('le', _format_value(bound)),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {total!r}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f'{self.name}{_format_labels(key)} {_format_value(value)}' for key, value in values)
+        return lines
+
+
+class Gauge:
+    """Gauge read at scrape time from ``fn``.
+
+    ``fn`` returns a number, or a list of ``(labels, value)`` pairs.
+    """
+
+    def __init__(self, name, help, fn):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        value = self.fn()
+        samples = value if isinstance(value, list) else [({}, value)]
+        for labels, sample in samples:
+            if sample is not None:
+                key = tuple(sorted(labels.items()))
+                lines.append(f'{self.name}{_format_labels(key)} {_format_value(sample)}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = OrderedDict()
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self._register(name, lambda: Histogram(name, help, buckets))
+
+    def counter(self, name, help):
+        return self._register(name, lambda: Counter(name, help))
+
+    def gauge(self, name, help, fn):
+        with self._lock:
+            self._metrics[name] = Gauge(name, help, fn)
+            return self._metrics[name]
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, name, create):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = create()
+            return metric
+
+
+class Timeline:
+    """Per-stage totals for one task, with offsets from the task's first span."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self._stages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, stage, started, ended):
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = {'count': 0, 'total': 0.0, 'max': 0.0,
+                                               'start': started, 'end': ended}
+            duration = ended - started
+            entry['count'] += 1
+            entry['total'] += duration
+            entry['max'] = max(entry['max'], duration)
+            entry['start'] = min(entry['start'], started)
+            entry['end'] = max(entry['end'], ended)
+
+    def snapshot(self):
+        with self._lock:
+            stages = list(self._stages.items())
+        return [{
+            'stage': stage,
+            'count': entry['count'],
+            'total_ms': round(entry['total'] * 1000, 1),
+            'max_ms': round(entry['max'] * 1000, 1),
+            'start_ms': round((entry['start'] - self.origin) * 1000, 1),
+            'end_ms': round((entry['end'] - self.origin) * 1000, 1),
+        } for stage, entry in sorted(stages, key=lambda item: item[1]['start'])]
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram('recce_stage_seconds', 'Time spent in each task stage.')
+STAGE_ERRORS = REGISTRY.counter('recce_stage_errors_total', 'Stages that raised an exception.')
+
+_timelines = OrderedDict()
+_timelines_lock = threading.Lock()
+
+
+def bind_task(task_id):
+    """Attribute spans in the current context (and tasks it spawns) to ``task_id``."""
+    _current_task.set(task_id)
+    _timeline(task_id)
+
+
+def current_task():
+    return _current_task.get()
+
+
+def _timeline(task_id):
+    with _timelines_lock:
+        timeline = _timelines.get(task_id)
+        if timeline is None:
+            timeline = _timelines[task_id] = Timeline()
+            while len(_timelines) > MAX_TIMELINES:
+                _timelines.popitem(last=False)
+        else:
+            _timelines.move_to_end(task_id)
+        return timeline
+
+
+def observe(stage, started, ended=None, task_id=None):
+    """Record a stage that ran from ``started`` to ``ended`` (``perf_counter`` values)."""
+    ended = time.perf_counter() if ended is None else ended
+    STAGE_SECONDS.observe(ended - started, stage=stage)
+    task_id = task_id or _current_task.get()
+    if task_id:
+        _timeline(task_id).record(stage, started, ended)
+
+
+@contextmanager
+def span(stage, task_id=None):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        observe(stage, started, task_id=task_id)
+
+
+def timeline(task_id):
+    with _timelines_lock:
+        timeline = _timelines.get(task_id)
+    return timeline.snapshot() if timeline else []
+
+
+def discard_timeline(task_id):
+    with _timelines_lock:
+        _timelines.pop(task_id, None)
+
+
+def render():
+    return REGISTRY.render()
@@ -0,0 +1,272 @@
+"""Capture profiles: which requests a page may make while it is captured.
+
+A profile blocks or stubs resource types and third-party tracking domains
+through Playwright request routing, caps the bytes a page may pull in for
+non-essential resources, and can freeze animations. First-party documents,
+scripts and XHR/fetch calls always go through, so API discovery sees the
+same traffic under every profile.
+
+Page bytes are measured from each finished request's reported sizes. Bytes
+saved are estimated: each blocked or stubbed request counts as the mean
+size of the responses of its type loaded so far by this worker.
+"""
+import base64
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from fingerprint import site_key
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE = os.getenv('CAPTURE_PROFILE', 'faithful')
+FAST_MAX_PAGE_BYTES = int(os.getenv('CAPTURE_FAST_MAX_PAGE_BYTES', 5 * 1024 * 1024))
+EXTRA_BLOCKED_DOMAINS = tuple(d.strip().lower() for d in os.getenv('CAPTURE_BLOCK_DOMAINS', '').split(',')
+                              if d.strip())
+# Chromium reports requests aborted with this reason as net::ERR_BLOCKED_BY_CLIENT
+BLOCKED_FAILURE = 'net::ERR_BLOCKED_BY_CLIENT'
+
+TRACKER_DOMAINS = (
+    'google-analytics.com', 'googletagmanager.com', 'googleadservices.com', 'googlesyndication.com',
+    'doubleclick.net', 'adservice.google.com', 'connect.facebook.net',
+    'analytics.tiktok.com', 'bat.bing.com', 'clarity.ms', 'hotjar.com', 'hotjar.io',
+    'fullstory.com', 'mixpanel.com', 'segment.io', 'segment.com', 'amplitude.com', 'heap.io',
+    'intercom.io', 'intercomcdn.com', 'hs-analytics.net', 'hs-scripts.com', 'newrelic.com',
+    'nr-data.net', 'sentry.io', 'optimizely.com', 'quantserve.com', 'scorecardresearch.com',
+    'criteo.com', 'criteo.net', 'taboola.com', 'outbrain.com', 'adnxs.com', 'amazon-adsystem.com',
+    'ads-twitter.com', 'snap.licdn.com', 'px.ads.linkedin.com',
+)
+# Resource types that do not carry API traffic or page structure, so a byte cap may drop them
+BUDGETED_TYPES = ('image', 'media', 'font', 'stylesheet', 'texttrack', 'manifest', 'other')
+TRANSPARENT_GIF = base64.b64decode('R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7')
+# Starting estimates for bytes saved per blocked request, until a type has loaded samples
+TYPICAL_BYTES = {
+    'image': 40 * 1024, 'media': 512 * 1024, 'font': 32 * 1024, 'stylesheet': 24 * 1024,
+    'script': 64 * 1024, 'texttrack': 4 * 1024, 'manifest': 1024, 'xhr': 4 * 1024, 'fetch': 4 * 1024,
+}
+DEFAULT_TYPICAL_BYTES = 4 * 1024
+STUB_RESPONSES = {
+    'image': {'status': 200, 'content_type': 'image/gif', 'body': TRANSPARENT_GIF},
+    'stylesheet': {'status': 200, 'content_type': 'text/css', 'body': ''},
+    'font': {'status': 200, 'content_type': 'font/woff2', 'body': b''},
+    'media': {'status': 200, 'content_type': 'video/mp4', 'body': b''},
+}
+
+BLOCKED_REQUESTS = REGISTRY.counter('recce_capture_blocked_requests_total',
+                                    'Requests blocked or stubbed by capture profiles.')
+SAVED_BYTES = REGISTRY.counter('recce_capture_saved_bytes_total',
+                               'Estimated response bytes not loaded because capture profiles blocked them.')
+PAGE_BYTES = REGISTRY.histogram('recce_capture_page_bytes', 'Response bytes loaded per captured page.',
+                                buckets=(64e3, 256e3, 1e6, 2.5e6, 5e6, 10e6, 25e6, 50e6))
+
+
+def _matches_domain(url, domains):
+    host = (urlparse(url).hostname or '').lower()
+    return any(host == domain or host.endswith('.' + domain) for domain in domains)
+
+
+class ResponseSizes:
+    """Running mean response size per resource type across every capture in the worker."""
+
+    def __init__(self):
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, resource_type, size):
+        with self._lock:
+            total, count = self._totals.get(resource_type, (0, 0))
+            self._totals[resource_type] = (total + size, count + 1)
+
+    def mean(self, resource_type):
+        with self._lock:
+            total, count = self._totals.get(resource_type, (0, 0))
+        if count:
+            return total // count
+        return TYPICAL_BYTES.get(resource_type, DEFAULT_TYPICAL_BYTES)
+
+
+RESPONSE_SIZES = ResponseSizes()
+
+
+class CaptureProfile:
+    """Request routing rules applied to every page of a capture."""
+
+    def __init__(self, name, block_types=(), stub_types=(), block_domains=(), max_page_bytes=None,
+                 reduced_motion=False, description=''):
+        self.name = name
+        self.block_types = frozenset(block_types)
+        self.stub_types = frozenset(stub_types)
+        self.block_domains = tuple(block_domains)
+        self.max_page_bytes = max_page_bytes
+        self.reduced_motion = reduced_motion
+        self.description = description
+
+    @property
+    def routes(self):
+        return bool(self.block_types or self.stub_types or self.block_domains or self.max_page_bytes)
+
+    def context_options(self):
+        options = {}
+        if self.reduced_motion:
+            options['reduced_motion'] = 'reduce'
+        if self.routes:
+            # Requests answered by a service worker would skip page routing
+            options['service_workers'] = 'block'
+        return options
+
+    def screenshot_options(self):
+        return {'animations': 'disabled'} if self.reduced_motion else {}
+
+    async def attach(self, page, url, stats):
+        """Start routing ``page``'s requests; return the :class:`PageLoad` tracking it."""
+        load = PageLoad(self, site_key(url), stats)
+        page.on('requestfinished', load.finished)
+        if self.routes:
+            await page.route('**/*', load.route)
+        return load
+
+    def decide(self, request, site, loaded_bytes):
+        """Return ``(action, reason)`` for ``request``; action is continue, abort or stub."""
+        resource_type = request.resource_type
+        first_party = site_key(request.url) == site
+        if resource_type == 'document' and first_party:
+            return 'continue', None
+        if not first_party and _matches_domain(request.url, self.block_domains):
+            return 'abort', 'domain'
+        if resource_type in self.stub_types:
+            return 'stub', 'type'
+        if resource_type in self.block_types:
+            return 'abort', 'type'
+        if (self.max_page_bytes and resource_type in BUDGETED_TYPES
+                and loaded_bytes >= self.max_page_bytes):
+            return 'abort', 'budget'
+        return 'continue', None
+
+
+class PageLoad:
+    """Load time, bytes and blocked requests for one captured page."""
+
+    def __init__(self, profile, site, stats):
+        self.profile = profile
+        self.site = site
+        self.stats = stats
+        self.started = time.perf_counter()
+        self.bytes = 0
+        self.blocked = 0
+        self.saved = 0
+        self._stubbed = set()
+
+    async def route(self, route):
+        request = route.request
+        action, reason = self.profile.decide(request, self.site, self.bytes)
+        try:
+            if action == 'continue':
+                await route.continue_()
+                return
+            saved = RESPONSE_SIZES.mean(request.resource_type)
+            self.blocked += 1
+            self.saved += saved
+            BLOCKED_REQUESTS.inc(profile=self.profile.name, reason=reason, type=request.resource_type)
+            SAVED_BYTES.inc(saved, profile=self.profile.name, type=request.resource_type)
+            self.stats.blocked(reason, request.resource_type, saved)
+            if action == 'stub':
+                self._stubbed.add(request)
+                await route.fulfill(**STUB_RESPONSES.get(request.resource_type, {'status': 204}))
+            else:
+                await route.abort('blockedbyclient')
+        except Exception as e:
+            # The page may have closed while the request was being routed
+            logger.debug(f"Could not route {request.url}: {e}")
+
+    async def finished(self, request):
+        # Stub bodies are ours, not the site's, so they are not counted
+        if request in self._stubbed:
+            self._stubbed.discard(request)
+            return
+        try:
+            sizes = await request.sizes()
+        except Exception as e:
+            logger.debug(f"Could not read sizes for {request.url}: {e}")
+            return
+        # Body bytes as received (before decompression), whether or not Content-Length was sent
+        size = max(0, sizes['responseBodySize']) + max(0, sizes['responseHeadersSize'])
+        self.bytes += size
+        RESPONSE_SIZES.add(request.resource_type, size)
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.started
+        PAGE_BYTES.observe(self.bytes, profile=self.profile.name)
+        self.stats.page(elapsed, self.bytes)
+
+
+class CaptureStats:
+    """Per-task totals across a capture's pages, safe to snapshot from other threads."""
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.pages = 0
+        self.load_seconds = 0.0
+        self.max_load_seconds = 0.0
+        self.bytes = 0
+        self.saved_bytes = 0
+        self.blocked_by_reason = {}
+        self.blocked_by_type = {}
+        self.saved_by_type = {}
+        self._lock = threading.Lock()
+
+    def page(self, load_seconds, loaded_bytes):
+        with self._lock:
+            self.pages += 1
+            self.load_seconds += load_seconds
+            self.max_load_seconds = max(self.max_load_seconds, load_seconds)
+            self.bytes += loaded_bytes
+
+    def blocked(self, reason, resource_type, saved_bytes=0):
+        with self._lock:
+            self.blocked_by_reason[reason] = self.blocked_by_reason.get(reason, 0) + 1
+            self.blocked_by_type[resource_type] = self.blocked_by_type.get(resource_type, 0) + 1
+            self.saved_by_type[resource_type] = self.saved_by_type.get(resource_type, 0) + saved_bytes
+            self.saved_bytes += saved_bytes
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'profile': self.profile.name,
+                'pages': self.pages,
+                'mean_load_ms': round(self.load_seconds / self.pages * 1000, 1) if self.pages else None,
+                'max_load_ms': round(self.max_load_seconds * 1000, 1),
+                'bytes': self.bytes,
+                'mean_page_bytes': self.bytes // self.pages if self.pages else None,
+                'blocked': sum(self.blocked_by_reason.values()),
+                'blocked_by_reason': dict(self.blocked_by_reason),
+                'blocked_by_type': dict(self.blocked_by_type),
+                'saved_bytes_estimate': self.saved_bytes,
+                'saved_bytes_by_type': dict(self.saved_by_type),
+            }
+
+
+PROFILES = {
+    'faithful': CaptureProfile(
+        'faithful', description="Load everything, as a visitor's browser would."),
+    'fast': CaptureProfile(
+        'fast', block_types=('media', 'font', 'ping'), block_domains=TRACKER_DOMAINS + EXTRA_BLOCKED_DOMAINS,
+        max_page_bytes=FAST_MAX_PAGE_BYTES, reduced_motion=True,
+        description="Skip video, web fonts and trackers, and cap heavy assets per page."),
+    'api-discovery': CaptureProfile(
+        'api-discovery', block_types=('media', 'font', 'ping', 'texttrack', 'manifest'),
+        stub_types=('image', 'stylesheet'), block_domains=TRACKER_DOMAINS + EXTRA_BLOCKED_DOMAINS,
+        reduced_motion=True,
+        description="Keep only scripts and first-party API traffic; screenshots are unstyled."),
+}
+
+
+def get_profile(name=None):
+    """Profile called ``name``, falling back to ``CAPTURE_PROFILE`` for unknown names."""
+    name = name or DEFAULT_PROFILE
+    if name not in PROFILES:
+        logger.warning(f"Unknown capture profile {name!r}, using {DEFAULT_PROFILE}")
+        return PROFILES.get(DEFAULT_PROFILE, PROFILES['faithful'])
+    return PROFILES[name]
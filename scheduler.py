@@ -0,0 +1,303 @@
+"""Bounded, session-fair scheduling of task stages onto fixed worker pools."""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from task_store import TERMINAL_STATUSES
+
+logger = logging.getLogger(__name__)
+
+CRAWL_WORKERS = int(os.getenv('SCHEDULER_CRAWL_WORKERS', 4))
+CAPTURE_WORKERS = int(os.getenv('SCHEDULER_CAPTURE_WORKERS', 2))
+MAX_PENDING = int(os.getenv('SCHEDULER_MAX_PENDING', 32))
+MAX_PER_SESSION = int(os.getenv('SCHEDULER_MAX_PER_SESSION', 2))
+CANCEL_POLL_INTERVAL = float(os.getenv('SCHEDULER_CANCEL_POLL_INTERVAL', 1.0))
+
+
+class Busy(Exception):
+    """Raised by :meth:`Scheduler.admit` when no more work can be accepted."""
+
+
+def claim_name(key):
+    """Task store claim name for a coalescing ``key``."""
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+class Job:
+    """One task moving through this worker's stage pools.
+
+    ``cancelled`` is set once every session following the task has cancelled
+    it; running stages poll it or register callbacks with :meth:`on_cancel`.
+    """
+
+    def __init__(self, task_id, key, session_id):
+        self.task_id = task_id
+        self.key = key
+        self.session_id = session_id
+        self.stage = None
+        self.cancelled = threading.Event()
+        self._pending = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def on_cancel(self, callback):
+        """Call ``callback()`` on cancellation (now, if already cancelled); return an unregister function."""
+        with self._lock:
+            if not self.cancelled.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def _cancel(self):
+        with self._lock:
+            self.cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Cancel callback for task {self.task_id} failed: {e}")
+
+
+class FairQueue:
+    """Round-robin over per-session FIFO queues, so one session cannot starve others."""
+
+    def __init__(self):
+        self._sessions = OrderedDict()
+        self._condition = threading.Condition()
+
+    def put(self, job, fn):
+        with self._condition:
+            self._sessions.setdefault(job.session_id, deque()).append((job, fn))
+            self._condition.notify()
+
+    def get(self):
+        with self._condition:
+            while not self._sessions:
+                self._condition.wait()
+            session_id, items = next(iter(self._sessions.items()))
+            item = items.popleft()
+            # The session goes to the back of the rotation, or leaves it when drained
+            del self._sessions[session_id]
+            if items:
+                self._sessions[session_id] = items
+            return item
+
+    def remove(self, job):
+        with self._condition:
+            items = self._sessions.get(job.session_id)
+            if not items:
+                return False
+            kept = deque(item for item in items if item[0] is not job)
+            removed = len(kept) != len(items)
+            if kept:
+                self._sessions[job.session_id] = kept
+            else:
+                del self._sessions[job.session_id]
+            return removed
+
+    def __len__(self):
+        with self._condition:
+            return sum(len(items) for items in self._sessions.values())
+
+
+class Scheduler:
+    """Runs task stages on fixed-size pools with admission control.
+
+    At most ``max_pending`` tasks are admitted to this worker at once (queued
+    or running, in any stage) and at most ``max_per_session`` per session;
+    beyond that :meth:`admit` raises :class:`Busy`. Each stage has its own
+    pool of worker threads pulling from a :class:`FairQueue`.
+
+    Everything other workers need lives in the task store ``tasks``: the
+    sessions following each task, a claim per coalescing ``key`` so
+    submissions to any worker join an admitted task, and the
+    ``cancel_requested`` flag, which the owning worker polls every
+    ``cancel_poll_interval`` seconds when a task is cancelled elsewhere.
+    """
+
+    def __init__(self, tasks, stages=None, max_pending=MAX_PENDING, max_per_session=MAX_PER_SESSION,
+                 cancel_poll_interval=CANCEL_POLL_INTERVAL):
+        self.tasks = tasks
+        self.stages = stages or {'crawl': CRAWL_WORKERS, 'capture': CAPTURE_WORKERS}
+        self.max_pending = max_pending
+        self.max_per_session = max_per_session
+        self.cancel_poll_interval = cancel_poll_interval
+        self._queues = {stage: FairQueue() for stage in self.stages}
+        self._running = {stage: 0 for stage in self.stages}
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stats = {'admitted': 0, 'coalesced': 0, 'rejected': 0, 'cancelled': 0}
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for stage, workers in self.stages.items():
+                for i in range(workers):
+                    thread = threading.Thread(target=self._worker, args=(stage,),
+                                              name=f'{stage}-{i}', daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+            thread = threading.Thread(target=self._watch_cancellations, name='cancel-watch', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def admit(self, session_id, task_id, key=None, **fields):
+        """Admit a task for ``session_id``; return ``(task_id, coalesced)``.
+
+        When a running task on any worker holds the claim for ``key``, the
+        session follows it and ``(its_task_id, True)`` is returned. Otherwise
+        the task is created in the store with ``fields`` and holds a slot
+        here until its last stage finishes; queue its first stage with
+        :meth:`schedule`.
+        """
+        self.start()
+        name = claim_name(key) if key is not None else None
+        if name is not None:
+            owner = self._claim(name, task_id)
+            if owner != task_id:
+                self.tasks.follow(owner, session_id)
+                with self._lock:
+                    self._stats['coalesced'] += 1
+                return owner, True
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job.session_id == session_id)
+            if len(self._jobs) >= self.max_pending or active >= self.max_per_session:
+                self._stats['rejected'] += 1
+                job = None
+            else:
+                job = self._jobs[task_id] = Job(task_id, name, session_id)
+                self._stats['admitted'] += 1
+        if job is None:
+            if name is not None:
+                self.tasks.release(name, task_id)
+            raise Busy(f"{len(self._jobs)} tasks pending")
+        try:
+            self.tasks.create(task_id, claim=name, **fields)
+            self.tasks.follow(task_id, session_id)
+        except Exception:
+            self._finish(job)
+            raise
+        return task_id, False
+
+    def schedule(self, task_id, stage, fn):
+        """Queue ``fn(job)`` on ``stage`` for a task admitted to this worker."""
+        with self._lock:
+            job = self._jobs.get(task_id)
+            if job is not None and not job.cancelled.is_set():
+                self._enqueue(job, stage, fn)
+
+    def cancel(self, task_id, session_id):
+        """Stop following a task; return 'cancelled', 'detached' or None if unknown.
+
+        The task itself is only cancelled once no other session follows it,
+        whichever worker runs it.
+        """
+        if self.tasks.get_field(task_id, 'status') in TERMINAL_STATUSES:
+            return None
+        remaining = self.tasks.unfollow(task_id, session_id)
+        if remaining is None:
+            return None
+        if remaining:
+            return 'detached'
+        self.tasks.update(task_id, cancel_requested=True)
+        # A cancelled task can no longer absorb new requests
+        name = self.tasks.get_field(task_id, 'claim')
+        if name is not None:
+            self.tasks.release(name, task_id)
+        with self._lock:
+            self._stats['cancelled'] += 1
+            job = self._jobs.get(task_id)
+        if job is not None:
+            self._cancel(job)
+        return 'cancelled'
+
+    def get(self, task_id):
+        with self._lock:
+            return self._jobs.get(task_id)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._jobs)
+            stats['running'] = dict(self._running)
+        stats['queued'] = {stage: len(queue) for stage, queue in self._queues.items()}
+        return stats
+
+    def _claim(self, name, task_id):
+        # Returns the task now holding the claim: a running one, or task_id
+        while True:
+            owner = self.tasks.claim(name, task_id)
+            if owner == task_id:
+                return owner
+            if (self.tasks.exists(owner) and self.tasks.get_field(owner, 'status') not in TERMINAL_STATUSES
+                    and not self.tasks.get_field(owner, 'cancel_requested')):
+                return owner
+            # Left behind by a task that ended or by a worker that went away
+            self.tasks.release(name, owner)
+
+    def _cancel(self, job):
+        with self._lock:
+            dequeued = job.stage is None or self._queues[job.stage].remove(job)
+        if dequeued:
+            self._finish(job)
+        job._cancel()
+
+    def _enqueue(self, job, stage, fn):
+        job.stage = stage
+        job._pending = True
+        self._queues[stage].put(job, fn)
+
+    def _finish(self, job):
+        with self._lock:
+            if self._jobs.pop(job.task_id, None) is None:
+                return
+        if job.key is not None:
+            self.tasks.release(job.key, job.task_id)
+
+    def _watch_cancellations(self):
+        while True:
+            time.sleep(self.cancel_poll_interval)
+            with self._lock:
+                jobs = [job for job in self._jobs.values() if not job.cancelled.is_set()]
+            for job in jobs:
+                try:
+                    requested = self.tasks.get_field(job.task_id, 'cancel_requested')
+                except Exception as e:
+                    logger.warning(f"Could not check task {job.task_id} for cancellation: {e}")
+                    break
+                if requested:
+                    logger.info(f"Task {job.task_id} was cancelled from another worker")
+                    self._cancel(job)
+
+    def _worker(self, stage):
+        queue = self._queues[stage]
+        while True:
+            job, fn = queue.get()
+            with self._lock:
+                job._pending = False
+                self._running[stage] += 1
+            try:
+                if not job.cancelled.is_set():
+                    fn(job)
+            except Exception as e:
+                logger.error(f"Unhandled error in {stage} stage of task {job.task_id}: {e}")
+            finally:
+                with self._lock:
+                    self._running[stage] -= 1
+                    # Done unless the stage queued a follow-up stage
+                    done = not job._pending
+                if done:
+                    self._finish(job)
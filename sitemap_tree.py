@@ -0,0 +1,120 @@
+"""Incremental sitemap trie and per-task cache of its rendered fragment."""
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+from markupsafe import escape
+
+MAX_CACHED_TASKS = int(os.getenv('SITEMAP_CACHE_MAX_TASKS', 256))
+
+
+class _TrieNode:
+    __slots__ = ('url', 'children')
+
+    def __init__(self, url=''):
+        self.url = url
+        self.children = {}
+
+
+class SitemapTrie:
+    """Path trie of crawled URLs with dict-keyed children.
+
+    ``version`` increases whenever a URL adds a node, so renderers can tell
+    whether anything visible changed.
+    """
+
+    def __init__(self):
+        self.root = _TrieNode()
+        self.version = 0
+
+    def add(self, url):
+        parsed = urlparse(url)
+        path_parts = [part for part in parsed.path.strip('/').split('/') if part]
+        node = self.root
+        for idx, part in enumerate(path_parts):
+            child = node.children.get(part)
+            if child is None:
+                full_url = f"{parsed.scheme}://{parsed.netloc}/{'/'.join(path_parts[:idx + 1])}"
+                child = node.children[part] = _TrieNode(full_url)
+                self.version += 1
+            node = child
+
+    def render(self):
+        """Return one HTML line per node, drawn like an anytree ``RenderTree``."""
+        lines = []
+        stack = [(iter(self.root.children.items()), len(self.root.children), '')]
+        while stack:
+            children, remaining, indent = stack[-1]
+            if not remaining:
+                stack.pop()
+                continue
+            name, node = next(children)
+            remaining -= 1
+            stack[-1] = (children, remaining, indent)
+            branch = '├── ' if remaining else '└── '
+            lines.append(f'{indent}{branch}<a href="{escape(node.url)}" target="_blank">{escape(name)}</a>')
+            if node.children:
+                stack.append((iter(node.children.items()), len(node.children),
+                              indent + ('│   ' if remaining else '    ')))
+        return lines
+
+
+class _Entry:
+    def __init__(self):
+        self.trie = SitemapTrie()
+        self.count = 0
+        self.lock = threading.Lock()
+        self.fragment = None
+        self.fragment_version = -1
+
+
+class SitemapCache:
+    """Per-task sitemap tries and their rendered fragments, least recently used first out.
+
+    The crawler feeds URLs in as they are discovered; a request for the
+    fragment only catches up on URLs this process has not seen yet and only
+    re-renders when the trie version changed.
+    """
+
+    def __init__(self, max_tasks=MAX_CACHED_TASKS):
+        self.max_tasks = max_tasks
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, task_id):
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if entry is None:
+                entry = self._entries[task_id] = _Entry()
+                while len(self._entries) > self.max_tasks:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(task_id)
+            return entry
+
+    def add(self, task_id, url, index):
+        """Add the sitemap URL stored at position ``index`` of the task's list."""
+        entry = self._entry(task_id)
+        with entry.lock:
+            # Out-of-order URLs are picked up by the next fragment request instead
+            if index == entry.count:
+                entry.trie.add(url)
+                entry.count += 1
+
+    def fragment(self, task_id, count, load_urls, render):
+        """Return the rendered fragment for a task whose sitemap holds ``count`` URLs.
+
+        ``load_urls(start)`` returns the stored URLs from ``start`` onwards and
+        ``render(lines)`` turns the tree lines into the HTML fragment.
+        """
+        entry = self._entry(task_id)
+        with entry.lock:
+            if entry.count < count:
+                for url in load_urls(entry.count):
+                    entry.trie.add(url)
+                    entry.count += 1
+            if entry.fragment is None or entry.fragment_version != entry.trie.version:
+                entry.fragment = render(entry.trie.render())
+                entry.fragment_version = entry.trie.version
+            return entry.fragment
@@ -0,0 +1,174 @@
+"""robots.txt rules and streaming sitemap.xml discovery for the crawler."""
+import logging
+import os
+import re
+import zlib
+from contextlib import aclosing
+from urllib.parse import urljoin, urlparse
+from xml.etree.ElementTree import ParseError, XMLPullParser
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+MAX_SITEMAPS = int(os.getenv('CRAWL_MAX_SITEMAPS', 20))
+MAX_CRAWL_DELAY = float(os.getenv('CRAWL_MAX_DELAY', 10))
+ROBOTS_MAX_BYTES = 512 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+DECOMPRESS_CHUNK = 256 * 1024
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _compile_pattern(pattern):
+    # '*' matches any run of characters and a trailing '$' anchors the end
+    anchored = pattern.endswith('$')
+    regex = re.escape(pattern.rstrip('$')).replace(r'\*', '.*')
+    return re.compile(regex + ('$' if anchored else ''))
+
+
+class RobotsRules:
+    """Allow/Disallow rules, Crawl-delay and Sitemap entries that apply to us."""
+
+    def __init__(self, rules=(), crawl_delay=None, sitemaps=()):
+        # Longest matching pattern wins, and Allow wins a tie
+        self.rules = [(_compile_pattern(pattern), allow, len(pattern)) for pattern, allow in rules]
+        self.crawl_delay = crawl_delay
+        self.sitemaps = list(sitemaps)
+
+    def allowed(self, url):
+        parsed = urlparse(url)
+        path = (parsed.path or '/') + (f'?{parsed.query}' if parsed.query else '')
+        best = None
+        for pattern, allow, length in self.rules:
+            if pattern.match(path) and (best is None or (length, allow) > best):
+                best = (length, allow)
+        return best is None or best[1]
+
+
+def parse_robots(text, agent='recce'):
+    """Parse robots.txt, keeping the groups for ``agent`` (or ``*`` when none name it)."""
+    groups = []
+    sitemaps = []
+    group = None
+    in_agents = False
+    for raw_line in text.splitlines():
+        line = raw_line.split('#', 1)[0].strip()
+        if ':' not in line:
+            continue
+        field, value = (part.strip() for part in line.split(':', 1))
+        field = field.lower()
+        if field == 'user-agent':
+            if not in_agents:
+                group = {'agents': [], 'rules': [], 'delay': None}
+                groups.append(group)
+            group['agents'].append(value.lower())
+            in_agents = True
+            continue
+        in_agents = False
+        if field == 'sitemap':
+            sitemaps.append(value)
+        elif group is None:
+            continue
+        elif field in ('allow', 'disallow') and value:
+            group['rules'].append((value, field == 'allow'))
+        elif field == 'crawl-delay':
+            try:
+                group['delay'] = float(value)
+            except ValueError:
+                pass
+
+    matching = [g for g in groups if any(name != '*' and name in agent for name in g['agents'])]
+    if not matching:
+        matching = [g for g in groups if '*' in g['agents']]
+    rules = [rule for g in matching for rule in g['rules']]
+    delays = [g['delay'] for g in matching if g['delay'] is not None]
+    return RobotsRules(rules, min(max(delays), MAX_CRAWL_DELAY) if delays else None, sitemaps)
+
+
+async def fetch_robots(client, base_url, agent='recce'):
+    """Fetch and parse ``/robots.txt``; a missing or unreadable file allows everything."""
+    try:
+        with span('crawl.robots'):
+            response = await client.get(urljoin(base_url, '/robots.txt'))
+        if response.status_code != 200:
+            return RobotsRules()
+        return parse_robots(response.text[:ROBOTS_MAX_BYTES], agent)
+    except Exception as e:
+        logger.info(f"Could not read robots.txt for {base_url}: {e}")
+        return RobotsRules()
+
+
+async def iter_sitemap_urls(client, sitemap_urls, max_sitemaps=MAX_SITEMAPS):
+    """Yield page URLs from sitemaps, following sitemap indexes breadth-first.
+
+    Each file is streamed through an incremental XML parser (gunzipping it
+    when needed) and parsed elements are discarded as soon as they are read,
+    so memory stays flat however many entries a file lists. Close the
+    generator (``contextlib.aclosing``) to stop downloading early.
+    """
+    pending = list(sitemap_urls)
+    seen = set()
+    while pending and len(seen) < max_sitemaps:
+        sitemap_url = pending.pop(0)
+        if sitemap_url in seen:
+            continue
+        seen.add(sitemap_url)
+        nested = []
+        try:
+            with span('crawl.sitemap'):
+                async with aclosing(_stream_sitemap(client, sitemap_url)) as entries:
+                    async for kind, loc in entries:
+                        if kind == 'sitemap':
+                            nested.append(loc)
+                        else:
+                            yield loc
+        except (ParseError, zlib.error) as e:
+            logger.info(f"Unreadable sitemap {sitemap_url}: {e}")
+        except Exception as e:
+            logger.info(f"Could not fetch sitemap {sitemap_url}: {e}")
+        pending.extend(nested)
+
+
+async def _decoded_chunks(response):
+    # .xml.gz files arrive as raw gzip rather than Content-Encoding: gzip, so sniff
+    # the first bytes; output is inflated in bounded pieces to keep memory flat
+    decompressor = None
+    first = True
+    async for chunk in response.aiter_bytes():
+        if first:
+            first = False
+            if chunk.startswith(GZIP_MAGIC):
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if decompressor is None:
+            yield chunk
+            continue
+        while chunk:
+            yield decompressor.decompress(chunk, DECOMPRESS_CHUNK)
+            chunk = decompressor.unconsumed_tail
+    if decompressor is not None:
+        yield decompressor.flush()
+
+
+async def _stream_sitemap(client, sitemap_url):
+    async with client.stream('GET', sitemap_url) as response:
+        if response.status_code != 200:
+            return
+        parser = XMLPullParser(events=('start', 'end'))
+        root = None
+        async for data in _decoded_chunks(response):
+            parser.feed(data)
+            for event, element in parser.read_events():
+                if event == 'start':
+                    if root is None:
+                        root = element
+                    continue
+                name = _local_name(element.tag)
+                if name in ('url', 'sitemap'):
+                    loc = next((child.text for child in element if _local_name(child.tag) == 'loc'), None)
+                    if loc and loc.strip():
+                        yield name, loc.strip()
+                    root.clear()
+        parser.close()
@@ -0,0 +1,179 @@
+"""Artifact storage backends: S3 for deploys, local disk for development and benchmarks."""
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 's3')
+S3_BUCKET = os.getenv('S3_BUCKET', 'recce-results')
+S3_REGION = os.getenv('S3_REGION', 'ca-central-1')
+LOCAL_STORAGE_ROOT = os.getenv('STORAGE_LOCAL_ROOT', os.path.join(tempfile.gettempdir(), 'recce-artifacts'))
+LOCAL_STORAGE_URL = '/artifacts'
+MULTIPART_THRESHOLD = int(os.getenv('UPLOAD_MULTIPART_THRESHOLD', 8 * 1024 * 1024))
+PRESIGNED_URL_EXPIRATION = 86400
+# Cached URLs are replaced this long before they expire, so a page rendered
+# from the cache still has a usable link when the user clicks it
+URL_REFRESH_MARGIN = int(os.getenv('STORAGE_URL_REFRESH_MARGIN', 3600))
+URL_CACHE_SIZE = int(os.getenv('STORAGE_URL_CACHE_SIZE', 4096))
+
+
+def create_s3_client(region_name=S3_REGION, max_pool_connections=None):
+    import boto3
+    from botocore.config import Config
+    from uploads import UPLOAD_WORKERS
+    # Every upload worker plus its multipart threads needs its own connection
+    config = Config(max_pool_connections=max_pool_connections or UPLOAD_WORKERS * 4,
+                    retries={'max_attempts': 3, 'mode': 'standard'})
+    return boto3.client('s3', region_name=region_name, config=config)
+
+
+class URLCache:
+    """Bounded LRU of URLs that are reused until ``margin`` seconds before they expire."""
+
+    def __init__(self, maxsize=URL_CACHE_SIZE, margin=URL_REFRESH_MARGIN):
+        self.maxsize = maxsize
+        self.margin = margin
+        self._urls = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._urls.get(key)
+            if entry is not None and entry[1] - self.margin > now:
+                self._urls.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, url, expires_at):
+        with self._lock:
+            self._urls[key] = (url, expires_at)
+            self._urls.move_to_end(key)
+            while len(self._urls) > self.maxsize:
+                self._urls.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self._urls), 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else None}
+
+
+class S3Storage:
+    """Objects in an S3 bucket, read through cached presigned URLs.
+
+    ``client`` may be an S3 client or a callable returning one; a callable is
+    only invoked on first use, so boto3 stays out of worker boot.
+    """
+
+    backend = 's3'
+
+    def __init__(self, client, bucket=S3_BUCKET, expiration=PRESIGNED_URL_EXPIRATION,
+                 multipart_threshold=MULTIPART_THRESHOLD, url_cache=None):
+        self._client = None if callable(client) else client
+        self._client_factory = client if callable(client) else None
+        self.bucket = bucket
+        self.expiration = expiration
+        self.multipart_threshold = multipart_threshold
+        self.urls = url_cache or URLCache()
+        self._transfer_config = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self._client_factory()
+            return self._client
+
+    @property
+    def transfer_config(self):
+        if self._transfer_config is None:
+            from boto3.s3.transfer import TransferConfig
+            self._transfer_config = TransferConfig(multipart_threshold=self.multipart_threshold,
+                                                   multipart_chunksize=self.multipart_threshold,
+                                                   max_concurrency=2)
+        return self._transfer_config
+
+    def put(self, key, body, content_type='application/octet-stream'):
+        # Objects larger than multipart_threshold go up as multipart uploads
+        self.client.upload_fileobj(io.BytesIO(body), self.bucket, key,
+                                   ExtraArgs={'ContentType': content_type}, Config=self.transfer_config)
+
+    def url(self, key):
+        url = self.urls.get(key)
+        if url is None:
+            expires_at = time.time() + self.expiration
+            url = self.client.generate_presigned_url('get_object', Params={'Bucket': self.bucket, 'Key': key},
+                                                     ExpiresIn=self.expiration)
+            self.urls.put(key, url, expires_at)
+        return url
+
+    def stats(self):
+        return {'backend': self.backend, 'bucket': self.bucket, 'urls': self.urls.stats()}
+
+
+class LocalStorage:
+    """Objects under a local directory, served by the app's ``/artifacts`` route.
+
+    Files are written to a temporary name and renamed into place, so a
+    request never sees a partly written artifact. Served URLs do not expire.
+    """
+
+    backend = 'local'
+
+    def __init__(self, root=LOCAL_STORAGE_ROOT, base_url=LOCAL_STORAGE_URL):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip('/')
+        self._written = 0
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        """Filesystem path for ``key``, or None when it would escape the root."""
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            return None
+        return path
+
+    def put(self, key, body, content_type='application/octet-stream'):
+        path = self.path(key)
+        if path is None:
+            raise ValueError(f"Invalid artifact key {key!r}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(body)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        with self._lock:
+            self._written += 1
+
+    def url(self, key):
+        return f'{self.base_url}/{quote(key)}'
+
+    def stats(self):
+        return {'backend': self.backend, 'root': self.root, 'written': self._written}
+
+
+def create_storage(backend=STORAGE_BACKEND):
+    """Storage selected by ``STORAGE_BACKEND`` ('s3' or 'local')."""
+    if backend == 'local':
+        logger.info(f"Storing artifacts under {LOCAL_STORAGE_ROOT}")
+        return LocalStorage()
+    if backend != 's3':
+        raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}")
+    # The S3 client is created on the first upload; boto3 is slow to import and set up
+    return S3Storage(create_s3_client)
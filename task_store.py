@@ -0,0 +1,442 @@
+"""Task state backends shared by the web workers and background tasks.
+
+Task state is a flat set of scalar fields (``status``, ``error``...) plus a
+few append-only list fields. Backends update single fields in place rather
+than rewriting the whole task, and evict finished tasks after a TTL.
+
+Each task also carries an ordered event log of small deltas (new sitemap URL,
+uploaded screenshot...) with sequential ids, which the progress stream
+replays from any ``Last-Event-ID``.
+
+The set of sessions following a task and named claims on tasks (used to
+join duplicate submissions) live here too, so every worker sees them.
+"""
+import json
+import os
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import OrderedDict
+
+LIST_FIELDS = ('sitemap_urls', 'screenshot_urls')
+TERMINAL_STATUSES = ('complete', 'failed', 'cancelled')
+FINISHED_TTL = int(os.getenv('TASK_FINISHED_TTL', 3600))
+ACTIVE_TTL = int(os.getenv('TASK_ACTIVE_TTL', 86400))
+MAX_TASKS = int(os.getenv('TASK_STORE_MAX_TASKS', 1000))
+EVENT_POLL_INTERVAL = 0.5
+
+
+class TaskStore(ABC):
+    """Interface implemented by every task state backend."""
+
+    @abstractmethod
+    def create(self, task_id, **fields):
+        ...
+
+    @abstractmethod
+    def exists(self, task_id):
+        ...
+
+    @abstractmethod
+    def get(self, task_id):
+        """Return the full task as a dict, or ``None`` if it does not exist."""
+
+    @abstractmethod
+    def get_field(self, task_id, field, default=None):
+        ...
+
+    @abstractmethod
+    def update(self, task_id, **fields):
+        ...
+
+    def append(self, task_id, field, value):
+        return self.extend(task_id, field, [value])
+
+    @abstractmethod
+    def extend(self, task_id, field, values):
+        """Append ``values`` to a list field and return its new length."""
+
+    @abstractmethod
+    def count(self, task_id, field):
+        ...
+
+    @abstractmethod
+    def get_list(self, task_id, field, start=0):
+        ...
+
+    @abstractmethod
+    def finish(self, task_id, **fields):
+        """Update ``fields`` and schedule the task for eviction."""
+
+    @abstractmethod
+    def publish(self, task_id, event, data):
+        """Append an event to the task's log and return its id."""
+
+    @abstractmethod
+    def events_since(self, task_id, last_id):
+        """Return ``(id, event, data)`` tuples for events after ``last_id``."""
+
+    @abstractmethod
+    def follow(self, task_id, session_id):
+        """Add ``session_id`` to the sessions following the task."""
+
+    @abstractmethod
+    def unfollow(self, task_id, session_id):
+        """Remove ``session_id``; return how many sessions still follow, or ``None`` if it did not."""
+
+    @abstractmethod
+    def claim(self, name, task_id):
+        """Point ``name`` at ``task_id`` unless it already points at a task; return the task it points at."""
+
+    @abstractmethod
+    def release(self, name, task_id):
+        """Drop ``name`` if it still points at ``task_id``."""
+
+    def wait_for_events(self, task_id, last_id, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            events = self.events_since(task_id, last_id)
+            if events or time.monotonic() >= deadline:
+                return events
+            time.sleep(EVENT_POLL_INTERVAL)
+
+
+class MemoryTaskStore(TaskStore):
+    """Process-local store with LRU and TTL eviction, for a single worker."""
+
+    def __init__(self, max_tasks=MAX_TASKS, finished_ttl=FINISHED_TTL, active_ttl=ACTIVE_TTL):
+        self.max_tasks = max_tasks
+        self.finished_ttl = finished_ttl
+        self.active_ttl = active_ttl
+        self._tasks = OrderedDict()
+        self._expires = {}
+        self._finished = set()
+        self._events = {}
+        self._followers = {}
+        self._claims = {}
+        self._lock = threading.RLock()
+        self._published = threading.Condition(self._lock)
+
+    def create(self, task_id, **fields):
+        with self._lock:
+            self._evict()
+            task = {field: [] for field in LIST_FIELDS}
+            task.update(fields)
+            self._tasks[task_id] = task
+            self._events[task_id] = []
+            self._followers[task_id] = set()
+            self._expires[task_id] = time.monotonic() + self.active_ttl
+
+    def exists(self, task_id):
+        with self._lock:
+            return self._touch(task_id) is not None
+
+    def get(self, task_id):
+        with self._lock:
+            task = self._touch(task_id)
+            if task is None:
+                return None
+            return {key: list(value) if key in LIST_FIELDS else value for key, value in task.items()}
+
+    def get_field(self, task_id, field, default=None):
+        with self._lock:
+            task = self._touch(task_id)
+            if task is None or field not in task:
+                return default
+            value = task[field]
+            return list(value) if field in LIST_FIELDS else value
+
+    def update(self, task_id, **fields):
+        with self._lock:
+            task = self._touch(task_id)
+            if task is not None:
+                task.update(fields)
+
+    def extend(self, task_id, field, values):
+        with self._lock:
+            task = self._touch(task_id)
+            if task is None:
+                return 0
+            items = task.setdefault(field, [])
+            items.extend(values)
+            return len(items)
+
+    def count(self, task_id, field):
+        with self._lock:
+            task = self._touch(task_id)
+            return len(task.get(field, [])) if task is not None else 0
+
+    def get_list(self, task_id, field, start=0):
+        with self._lock:
+            task = self._touch(task_id)
+            return task.get(field, [])[start:] if task is not None else []
+
+    def finish(self, task_id, **fields):
+        with self._lock:
+            self.update(task_id, **fields)
+            if task_id in self._tasks:
+                self._expires[task_id] = time.monotonic() + self.finished_ttl
+                self._finished.add(task_id)
+
+    def publish(self, task_id, event, data):
+        with self._lock:
+            if self._touch(task_id) is None:
+                return None
+            events = self._events[task_id]
+            events.append((len(events) + 1, event, data))
+            self._published.notify_all()
+            return len(events)
+
+    def events_since(self, task_id, last_id):
+        with self._lock:
+            if self._touch(task_id) is None:
+                return []
+            return self._events[task_id][last_id:]
+
+    def follow(self, task_id, session_id):
+        with self._lock:
+            if self._touch(task_id) is not None:
+                self._followers[task_id].add(session_id)
+
+    def unfollow(self, task_id, session_id):
+        with self._lock:
+            if self._touch(task_id) is None or session_id not in self._followers[task_id]:
+                return None
+            self._followers[task_id].discard(session_id)
+            return len(self._followers[task_id])
+
+    def claim(self, name, task_id):
+        with self._lock:
+            entry = self._claims.get(name)
+            if entry is not None and entry[1] > time.monotonic():
+                return entry[0]
+            self._claims[name] = (task_id, time.monotonic() + self.active_ttl)
+            return task_id
+
+    def release(self, name, task_id):
+        with self._lock:
+            entry = self._claims.get(name)
+            if entry is not None and entry[0] == task_id:
+                del self._claims[name]
+
+    def wait_for_events(self, task_id, last_id, timeout):
+        deadline = time.monotonic() + timeout
+        with self._published:
+            while True:
+                events = self.events_since(task_id, last_id)
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                self._published.wait(remaining)
+
+    def _touch(self, task_id):
+        task = self._tasks.get(task_id)
+        if task is None:
+            return None
+        if self._expires[task_id] <= time.monotonic():
+            self._remove(task_id)
+            return None
+        self._tasks.move_to_end(task_id)
+        return task
+
+    def _remove(self, task_id):
+        self._tasks.pop(task_id, None)
+        self._expires.pop(task_id, None)
+        self._events.pop(task_id, None)
+        self._followers.pop(task_id, None)
+        self._finished.discard(task_id)
+
+    def _evict(self):
+        now = time.monotonic()
+        for task_id in [t for t, expires in self._expires.items() if expires <= now]:
+            self._remove(task_id)
+        for name in [n for n, (_, expires) in self._claims.items() if expires <= now]:
+            del self._claims[name]
+        # Least recently used finished tasks go first, running tasks only if unavoidable
+        while len(self._tasks) >= self.max_tasks:
+            victim = next((t for t in self._tasks if t in self._finished), None)
+            self._remove(victim if victim is not None else next(iter(self._tasks)))
+
+
+class RedisTaskStore(TaskStore):
+    """Store shared by every worker process through Redis.
+
+    Scalar fields live in one hash per task and each list field in its own
+    Redis list, so appends never rewrite the rest of the task. Keys carry an
+    active TTL while the task runs and a shorter one once it finishes.
+    """
+
+    def __init__(self, client, prefix='recce:task:', finished_ttl=FINISHED_TTL, active_ttl=ACTIVE_TTL):
+        self.client = client
+        self.prefix = prefix
+        self.finished_ttl = finished_ttl
+        self.active_ttl = active_ttl
+
+    def _key(self, task_id, field=None):
+        return f'{self.prefix}{task_id}' if field is None else f'{self.prefix}{task_id}:{field}'
+
+    def _keys(self, task_id):
+        fields = LIST_FIELDS + ('events', 'sessions')
+        return [self._key(task_id)] + [self._key(task_id, field) for field in fields]
+
+    def create(self, task_id, **fields):
+        pipe = self.client.pipeline()
+        pipe.delete(*self._keys(task_id))
+        pipe.hset(self._key(task_id), mapping={'created': json.dumps(time.time()),
+                                                **{k: json.dumps(v) for k, v in fields.items()}})
+        pipe.expire(self._key(task_id), self.active_ttl)
+        pipe.execute()
+
+    def exists(self, task_id):
+        return bool(self.client.exists(self._key(task_id)))
+
+    def get(self, task_id):
+        pipe = self.client.pipeline()
+        pipe.hgetall(self._key(task_id))
+        for field in LIST_FIELDS:
+            pipe.lrange(self._key(task_id, field), 0, -1)
+        scalars, *lists = pipe.execute()
+        if not scalars:
+            return None
+        task = {_decode(k): json.loads(v) for k, v in scalars.items()}
+        task.pop('created', None)
+        for field, values in zip(LIST_FIELDS, lists):
+            task[field] = [json.loads(v) for v in values]
+        return task
+
+    def get_field(self, task_id, field, default=None):
+        if field in LIST_FIELDS:
+            if not self.exists(task_id):
+                return default
+            return [json.loads(v) for v in self.client.lrange(self._key(task_id, field), 0, -1)]
+        value = self.client.hget(self._key(task_id), field)
+        return default if value is None else json.loads(value)
+
+    def _write(self, task_id, commands):
+        """Queue ``commands(pipe, ttl)`` in a transaction, only while the task's hash exists.
+
+        ``ttl`` is the hash's remaining TTL, which list keys inherit so a
+        write to a finished task never pushes its eviction back. Returns the
+        transaction's results, or ``None`` when the task is gone.
+        """
+        from redis.exceptions import WatchError
+        key = self._key(task_id)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    ttl = pipe.ttl(key)
+                    if ttl == -2:
+                        pipe.unwatch()
+                        return None
+                    pipe.multi()
+                    commands(pipe, ttl)
+                    return pipe.execute()
+                except WatchError:
+                    continue
+
+    def update(self, task_id, **fields):
+        if fields:
+            self._write(task_id, lambda pipe, ttl: pipe.hset(
+                self._key(task_id), mapping={k: json.dumps(v) for k, v in fields.items()}))
+
+    def _push(self, task_id, field, values):
+        key = self._key(task_id, field)
+
+        def commands(pipe, ttl):
+            pipe.rpush(key, *values)
+            if ttl > 0:
+                pipe.expire(key, ttl)
+
+        results = self._write(task_id, commands)
+        return None if results is None else results[0]
+
+    def extend(self, task_id, field, values):
+        if not values:
+            return self.client.llen(self._key(task_id, field))
+        return self._push(task_id, field, [json.dumps(v) for v in values]) or 0
+
+    def count(self, task_id, field):
+        return self.client.llen(self._key(task_id, field))
+
+    def get_list(self, task_id, field, start=0):
+        return [json.loads(v) for v in self.client.lrange(self._key(task_id, field), start, -1)]
+
+    def finish(self, task_id, **fields):
+        def commands(pipe, ttl):
+            if fields:
+                pipe.hset(self._key(task_id), mapping={k: json.dumps(v) for k, v in fields.items()})
+            for key in self._keys(task_id):
+                pipe.expire(key, self.finished_ttl)
+
+        self._write(task_id, commands)
+
+    def publish(self, task_id, event, data):
+        return self._push(task_id, 'events', [json.dumps([event, data])])
+
+    def events_since(self, task_id, last_id):
+        values = self.client.lrange(self._key(task_id, 'events'), last_id, -1)
+        return [(last_id + i + 1, *json.loads(v)) for i, v in enumerate(values)]
+
+    def follow(self, task_id, session_id):
+        key = self._key(task_id, 'sessions')
+
+        def commands(pipe, ttl):
+            pipe.sadd(key, session_id)
+            if ttl > 0:
+                pipe.expire(key, ttl)
+
+        self._write(task_id, commands)
+
+    def unfollow(self, task_id, session_id):
+        key = self._key(task_id, 'sessions')
+
+        def commands(pipe, ttl):
+            pipe.srem(key, session_id)
+            pipe.scard(key)
+
+        results = self._write(task_id, commands)
+        if not results or not results[0]:
+            return None
+        return results[1]
+
+    def _claim_key(self, name):
+        return f'{self.prefix}claim:{name}'
+
+    def claim(self, name, task_id):
+        key = self._claim_key(name)
+        while True:
+            if self.client.set(key, task_id, nx=True, ex=self.active_ttl):
+                return task_id
+            existing = self.client.get(key)
+            if existing is not None:
+                return _decode(existing)
+
+    def release(self, name, task_id):
+        from redis.exceptions import WatchError
+        key = self._claim_key(name)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    if _decode(pipe.get(key)) != task_id:
+                        pipe.unwatch()
+                        return
+                    pipe.multi()
+                    pipe.delete(key)
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def create_task_store(redis_url=None):
+    redis_url = redis_url or os.getenv('REDIS_URL')
+    if redis_url:
+        import redis
+        return RedisTaskStore(redis.Redis.from_url(redis_url))
+    return MemoryTaskStore()
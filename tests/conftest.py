@@ -0,0 +1,14 @@
+import fakeredis
+import pytest
+
+from task_store import MemoryTaskStore, RedisTaskStore
+
+FINISHED_TTL = 60
+ACTIVE_TTL = 3600
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def store(request):
+    if request.param == 'memory':
+        return MemoryTaskStore(finished_ttl=FINISHED_TTL, active_ttl=ACTIVE_TTL)
+    return RedisTaskStore(fakeredis.FakeRedis(), finished_ttl=FINISHED_TTL, active_ttl=ACTIVE_TTL)
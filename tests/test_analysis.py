@@ -0,0 +1,141 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import analysis
+from analysis import AnalysisCache, ConceptAnalyzer, cache_key, normalize_concepts
+
+
+class FakeClient:
+    """``chat.completions.create`` that counts calls, optionally failing or waiting on ``gate``."""
+
+    def __init__(self, content='1. First\n\n2. Second\n3. Third\n4. Fourth', fail=False, gate=None):
+        self.content = content
+        self.fail = fail
+        self.gate = gate
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.fail:
+            raise RuntimeError("LLM unavailable")
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.content))])
+
+
+@pytest.fixture
+def client():
+    return FakeClient()
+
+
+@pytest.fixture
+def analyzer(client):
+    return ConceptAnalyzer(client=client, cache=AnalysisCache(), workers=2)
+
+
+def test_normalize_concepts():
+    assert normalize_concepts('  Supply\tChain ', 'DEMAND') == ('supply chain', 'demand')
+    assert normalize_concepts(None, '') == ('', '')
+    assert cache_key('Supply  Chain', 'Demand') == cache_key('supply chain', ' demand')
+    assert cache_key('a', 'b') != cache_key('b', 'a')
+
+
+def test_result_is_memoized(analyzer, client):
+    assert analyzer.result('Supply Chain', 'Demand') == ['1. First', '2. Second', '3. Third']
+    assert analyzer.result(' supply  chain', 'DEMAND') == ['1. First', '2. Second', '3. Third']
+    assert client.calls == 1
+    stats = analyzer.stats()
+    assert (stats['misses'], stats['memory_hits'], stats['llm_calls']) == (1, 1, 1)
+    assert stats['hit_rate'] == 0.5
+
+
+def test_concurrent_requests_share_one_call():
+    gate = threading.Event()
+    client = FakeClient(gate=gate)
+    analyzer = ConceptAnalyzer(client=client, cache=AnalysisCache(), workers=2)
+    first = analyzer.start('a', 'b')
+    assert analyzer.start('A', ' b ') is first
+    assert analyzer.peek('a', 'b', start=True) == (False, None)
+    assert analyzer.stats()['inflight'] == 1
+    gate.set()
+    assert first.result(timeout=5) == ['1. First', '2. Second', '3. Third']
+    assert client.calls == 1
+    assert analyzer.stats()['inflight'] == 0
+    assert analyzer.start('a', 'b') is None
+
+
+def test_peek_counts_one_lookup_per_request(analyzer):
+    analyzer.result('a', 'b')
+    for _ in range(3):
+        assert analyzer.peek('a', 'b', start=True) == (True, ['1. First', '2. Second', '3. Third'])
+    stats = analyzer.stats()
+    assert (stats['misses'], stats['memory_hits']) == (1, 3)
+
+
+def test_peek_starts_missing_analysis_only_when_asked(analyzer, client):
+    assert analyzer.peek('a', 'b') == (False, None)
+    assert analyzer.stats()['misses'] == 0
+    ready, _ = analyzer.peek('a', 'b', start=True)
+    assert not ready
+    analyzer.result('a', 'b', timeout=5)
+    assert client.calls == 1
+
+
+def test_cached_result_expires(client):
+    analyzer = ConceptAnalyzer(client=client, cache=AnalysisCache(ttl=0.05))
+    analyzer.result('a', 'b')
+    analyzer.result('a', 'b')
+    assert client.calls == 1
+    time.sleep(0.1)
+    analyzer.result('a', 'b')
+    assert client.calls == 2
+
+
+def test_cache_evicts_least_recently_used():
+    cache = AnalysisCache(max_entries=2)
+    cache.set('a', [1])
+    cache.set('b', [2])
+    cache.get('a')
+    cache.set('c', [3])
+    assert cache.get('a') == ([1], 'memory')
+    assert cache.get('b') == (None, None)
+
+
+def test_failure_backs_off_then_retries(monkeypatch):
+    monkeypatch.setattr(analysis, 'ANALYSIS_RETRY_AFTER', 0.05)
+    client = FakeClient(fail=True)
+    analyzer = ConceptAnalyzer(client=client, cache=AnalysisCache())
+    with pytest.raises(RuntimeError):
+        analyzer.result('a', 'b')
+    # Within the backoff the failure is reported as ready without calling the LLM again
+    assert analyzer.peek('a', 'b', start=True) == (True, None)
+    assert analyzer.start('a', 'b') is None
+    assert analyzer.result('a', 'b') is None
+    assert client.calls == 1
+    assert analyzer.stats()['errors'] == 1
+
+    time.sleep(0.1)
+    client.fail = False
+    assert analyzer.result('a', 'b') == ['1. First', '2. Second', '3. Third']
+    assert client.calls == 2
+
+
+def test_tier_hit_fills_memory(client):
+    class DictTier(dict):
+        def set(self, key, value):
+            self[key] = value
+
+    tier = DictTier()
+    ConceptAnalyzer(client=client, cache=AnalysisCache(tier=tier)).result('a', 'b')
+    analyzer = ConceptAnalyzer(client=client, cache=AnalysisCache(tier=tier))
+    analyzer.result('a', 'b')
+    analyzer.result('a', 'b')
+    assert client.calls == 1
+    stats = analyzer.stats()
+    assert (stats['tier_hits'], stats['memory_hits'], stats['misses']) == (1, 1, 0)
@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import Busy, Scheduler
+
+
+def make_scheduler(store, **kwargs):
+    kwargs.setdefault('stages', {'crawl': 1, 'capture': 1})
+    return Scheduler(store, cancel_poll_interval=0.02, **kwargs)
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_admission_limits(store):
+    scheduler = make_scheduler(store, max_pending=2, max_per_session=1)
+    assert scheduler.admit('s1', 't1', status='queued') == ('t1', False)
+    assert store.get_field('t1', 'status') == 'queued'
+    with pytest.raises(Busy):
+        scheduler.admit('s1', 't2')
+    assert scheduler.admit('s2', 't3') == ('t3', False)
+    with pytest.raises(Busy):
+        scheduler.admit('s3', 't4')
+    assert not store.exists('t2')
+    stats = scheduler.stats()
+    assert (stats['admitted'], stats['rejected'], stats['pending']) == (2, 2, 2)
+
+
+def test_slot_is_freed_after_last_stage(store):
+    scheduler = make_scheduler(store, max_pending=1)
+    ran = []
+
+    def crawl(job):
+        ran.append('crawl')
+        scheduler.schedule(job.task_id, 'capture', lambda job: ran.append('capture'))
+
+    scheduler.admit('s1', 't1')
+    scheduler.schedule('t1', 'crawl', crawl)
+    wait_until(lambda: scheduler.get('t1') is None)
+    assert ran == ['crawl', 'capture']
+    assert scheduler.admit('s1', 't2') == ('t2', False)
+
+
+def test_same_key_joins_admitted_task(store):
+    scheduler = make_scheduler(store)
+    assert scheduler.admit('s1', 't1', key=('https://a.test/', 1, 'fast')) == ('t1', False)
+    assert scheduler.admit('s2', 't2', key=('https://a.test/', 1, 'fast')) == ('t1', True)
+    assert scheduler.admit('s2', 't3', key=('https://a.test/', 2, 'fast')) == ('t3', False)
+    assert not store.exists('t2')
+    assert scheduler.stats()['coalesced'] == 1
+
+
+def test_same_key_joins_task_on_another_worker(store):
+    first, second = make_scheduler(store), make_scheduler(store)
+    assert first.admit('s1', 't1', key='site') == ('t1', False)
+    assert second.admit('s2', 't2', key='site') == ('t1', True)
+    assert second.get('t1') is None
+    # Both sessions follow the task, wherever it runs
+    assert second.cancel('t1', 's1') == 'detached'
+
+
+def test_finished_task_releases_its_key(store):
+    scheduler = make_scheduler(store)
+    scheduler.admit('s1', 't1', key='site')
+    scheduler.schedule('t1', 'crawl', lambda job: store.finish('t1', status='complete'))
+    wait_until(lambda: scheduler.get('t1') is None)
+    assert scheduler.admit('s2', 't2', key='site') == ('t2', False)
+
+
+def test_key_of_ended_task_is_not_joined(store):
+    first, second = make_scheduler(store), make_scheduler(store)
+    first.admit('s1', 't1', key='site')
+    # The owning worker went away after marking the task failed, without releasing the key
+    store.finish('t1', status='failed')
+    assert second.admit('s2', 't2', key='site') == ('t2', False)
+
+
+def test_cancel_detaches_until_last_session(store):
+    scheduler = make_scheduler(store)
+    scheduler.admit('s1', 't1', key='site')
+    scheduler.admit('s2', 't2', key='site')
+    assert scheduler.cancel('t1', 'other') is None
+    assert scheduler.cancel('t1', 's1') == 'detached'
+    assert not scheduler.get('t1').cancelled.is_set()
+    assert scheduler.cancel('t1', 's2') == 'cancelled'
+    assert store.get_field('t1', 'cancel_requested') is True
+    assert scheduler.get('t1') is None
+    # A cancelled task no longer absorbs new submissions
+    assert scheduler.admit('s3', 't3', key='site') == ('t3', False)
+
+
+def test_cancel_queued_stage_never_runs(store):
+    scheduler = make_scheduler(store, stages={'crawl': 1})
+    gate = threading.Event()
+    ran = []
+    scheduler.admit('s1', 'busy')
+    scheduler.schedule('busy', 'crawl', lambda job: gate.wait(5))
+    scheduler.admit('s2', 't1')
+    scheduler.schedule('t1', 'crawl', lambda job: ran.append(job.task_id))
+    assert scheduler.cancel('t1', 's2') == 'cancelled'
+    assert scheduler.get('t1') is None
+    gate.set()
+    wait_until(lambda: scheduler.get('busy') is None)
+    assert ran == []
+
+
+def test_cancel_from_another_worker_stops_running_task(store):
+    owner, other = make_scheduler(store), make_scheduler(store)
+    started = threading.Event()
+    callbacks = []
+
+    def crawl(job):
+        job.on_cancel(lambda: callbacks.append(job.task_id))
+        started.set()
+        job.cancelled.wait(5)
+
+    owner.admit('s1', 't1')
+    owner.schedule('t1', 'crawl', crawl)
+    assert started.wait(5)
+    assert other.cancel('t1', 's1') == 'cancelled'
+    wait_until(lambda: owner.get('t1') is None)
+    assert callbacks == ['t1']
+    assert other.stats()['cancelled'] == 1
+
+
+def test_cancel_finished_or_unknown_task(store):
+    scheduler = make_scheduler(store)
+    assert scheduler.cancel('missing', 's1') is None
+    scheduler.admit('s1', 't1')
+    store.finish('t1', status='complete')
+    assert scheduler.cancel('t1', 's1') is None
@@ -0,0 +1,132 @@
+import time
+
+from conftest import FINISHED_TTL
+from task_store import MemoryTaskStore, RedisTaskStore
+
+
+def remaining_ttl(store, task_id, field=None):
+    if isinstance(store, MemoryTaskStore):
+        return store._expires[task_id] - time.monotonic()
+    return store.client.ttl(store._key(task_id, field))
+
+
+def test_create_get_update(store):
+    store.create('t', status='running', url='https://example.com')
+    store.update('t', status='complete', error=None)
+    assert store.exists('t')
+    assert store.get('t') == {'status': 'complete', 'url': 'https://example.com', 'error': None,
+                              'sitemap_urls': [], 'screenshot_urls': []}
+    assert store.get_field('t', 'status') == 'complete'
+    assert store.get_field('t', 'missing', 'default') == 'default'
+    assert store.get_field('t', 'sitemap_urls') == []
+
+
+def test_lists(store):
+    store.create('t')
+    assert store.extend('t', 'sitemap_urls', ['a', 'b']) == 2
+    assert store.append('t', 'sitemap_urls', 'c') == 3
+    assert store.extend('t', 'sitemap_urls', []) == 3
+    assert store.count('t', 'sitemap_urls') == 3
+    assert store.get_list('t', 'sitemap_urls', start=1) == ['b', 'c']
+    assert store.get('t')['sitemap_urls'] == ['a', 'b', 'c']
+
+
+def test_events(store):
+    store.create('t')
+    assert store.publish('t', 'page', {'url': 'a'}) == 1
+    assert store.publish('t', 'page', {'url': 'b'}) == 2
+    assert store.events_since('t', 0) == [(1, 'page', {'url': 'a'}), (2, 'page', {'url': 'b'})]
+    assert store.events_since('t', 1) == [(2, 'page', {'url': 'b'})]
+    assert store.events_since('t', 2) == []
+    assert store.wait_for_events('t', 1, timeout=0) == [(2, 'page', {'url': 'b'})]
+
+
+def test_create_resets_task(store):
+    store.create('t', status='running')
+    store.append('t', 'screenshot_urls', 'a')
+    store.publish('t', 'page', 'a')
+    store.create('t', status='queued')
+    assert store.get('t')['status'] == 'queued'
+    assert store.get('t')['screenshot_urls'] == []
+    assert store.events_since('t', 0) == []
+
+
+def test_writes_to_missing_task_are_ignored(store):
+    store.update('gone', status='running')
+    assert store.extend('gone', 'sitemap_urls', ['a']) == 0
+    assert store.publish('gone', 'page', 'a') is None
+    store.finish('gone', status='complete')
+    assert not store.exists('gone')
+    assert store.get('gone') is None
+    assert store.get_field('gone', 'sitemap_urls') is None
+    assert store.count('gone', 'sitemap_urls') == 0
+    assert store.events_since('gone', 0) == []
+
+
+def test_finish_shortens_ttl(store):
+    store.create('t', status='running')
+    assert remaining_ttl(store, 't') > FINISHED_TTL
+    store.finish('t', status='complete')
+    assert store.get_field('t', 'status') == 'complete'
+    assert 0 < remaining_ttl(store, 't') <= FINISHED_TTL
+
+
+def test_writes_after_finish_keep_finished_ttl(store):
+    store.create('t')
+    store.finish('t', status='complete')
+    store.update('t', note='late')
+    store.append('t', 'screenshot_urls', 'a')
+    store.publish('t', 'page', 'a')
+    assert store.get_field('t', 'note') == 'late'
+    assert store.get_field('t', 'screenshot_urls') == ['a']
+    assert 0 < remaining_ttl(store, 't') <= FINISHED_TTL
+    if isinstance(store, RedisTaskStore):
+        assert 0 < remaining_ttl(store, 't', 'screenshot_urls') <= FINISHED_TTL
+        assert 0 < remaining_ttl(store, 't', 'events') <= FINISHED_TTL
+
+
+def test_expired_task_is_gone(store):
+    store.create('t')
+    store.append('t', 'sitemap_urls', 'a')
+    if isinstance(store, MemoryTaskStore):
+        store._expires['t'] = time.monotonic() - 1
+    else:
+        for key in store._keys('t'):
+            store.client.delete(key)
+    assert not store.exists('t')
+    assert store.get('t') is None
+    assert store.extend('t', 'sitemap_urls', ['b']) == 0
+    assert not store.exists('t')
+
+
+def test_memory_store_evicts_finished_tasks_first():
+    store = MemoryTaskStore(max_tasks=2)
+    store.create('running')
+    store.create('finished')
+    store.finish('finished')
+    store.create('new')
+    assert store.exists('running')
+    assert not store.exists('finished')
+    assert store.exists('new')
+
+
+def test_followers(store):
+    store.create('t')
+    store.follow('t', 'a')
+    store.follow('t', 'b')
+    store.follow('t', 'b')
+    assert store.unfollow('t', 'c') is None
+    assert store.unfollow('t', 'a') == 1
+    assert store.unfollow('t', 'a') is None
+    assert store.unfollow('t', 'b') == 0
+    store.follow('gone', 'a')
+    assert store.unfollow('gone', 'a') is None
+
+
+def test_claims(store):
+    assert store.claim('key', 't1') == 't1'
+    assert store.claim('key', 't2') == 't1'
+    store.release('key', 't2')
+    assert store.claim('key', 't2') == 't1'
+    store.release('key', 't1')
+    assert store.claim('key', 't2') == 't2'
@@ -0,0 +1,32 @@
+"""Low-resolution page thumbnails stitched from screenshot tiles."""
+import io
+import os
+
+THUMBNAIL_WIDTH = int(os.getenv('THUMBNAIL_WIDTH', 300))
+THUMBNAIL_QUALITY = 70
+
+
+class Thumbnail:
+    """A ``width`` by ``height`` page scaled down to ``thumb_width``, filled in tile by tile.
+
+    Each tile is decoded, shrunk and pasted as it arrives, so only one
+    full-resolution tile is held at a time.
+    """
+
+    def __init__(self, width, height, thumb_width=THUMBNAIL_WIDTH):
+        # Pillow is imported on first use so it stays out of worker boot
+        from PIL import Image
+        self.scale = min(1.0, thumb_width / width)
+        self.image = Image.new('RGB', (max(1, round(width * self.scale)), max(1, round(height * self.scale))),
+                               'white')
+
+    def add(self, png_bytes, y):
+        from PIL import Image
+        with Image.open(io.BytesIO(png_bytes)) as tile:
+            size = (self.image.width, max(1, round(tile.height * self.scale)))
+            self.image.paste(tile.convert('RGB').resize(size, Image.BILINEAR), (0, round(y * self.scale)))
+
+    def to_jpeg(self):
+        output = io.BytesIO()
+        self.image.save(output, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+        return output.getvalue()
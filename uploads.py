@@ -0,0 +1,126 @@
+"""Background upload pipeline for captured artifacts."""
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import observe, span
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', 4))
+UPLOAD_QUEUE_SIZE = int(os.getenv('UPLOAD_QUEUE_SIZE', 16))
+UPLOAD_MAX_ATTEMPTS = int(os.getenv('UPLOAD_MAX_ATTEMPTS', 4))
+UPLOAD_BACKOFF = float(os.getenv('UPLOAD_BACKOFF', 0.5))
+
+
+class _UploadJob:
+    def __init__(self, key, body, content_type):
+        self.key = key
+        self.body = body
+        self.content_type = content_type
+        self.future = Future()
+        self.context = contextvars.copy_context()  # Keeps the submitting task for metrics
+        self.submitted = time.perf_counter()
+
+
+class UploadQueue:
+    """Bounded queue of uploads drained by a pool of worker threads.
+
+    :meth:`submit` blocks while the queue is full so capture cannot outrun
+    storage. Each upload is retried with exponential backoff, and the
+    returned future resolves to the artifact's URL only once ``storage``
+    (see :mod:`storage`) has stored the object.
+    """
+
+    def __init__(self, storage, workers=UPLOAD_WORKERS, maxsize=UPLOAD_QUEUE_SIZE,
+                 max_attempts=UPLOAD_MAX_ATTEMPTS, backoff=UPLOAD_BACKOFF):
+        self.storage = storage
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._queue = queue.Queue(maxsize)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'upload-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, key, body, content_type='image/png', timeout=None):
+        """Queue ``body`` for upload under ``key`` and return a future for its URL.
+
+        Blocks while the queue is full; raises ``queue.Full`` if ``timeout``
+        seconds pass without a free slot.
+        """
+        self.start()
+        job = _UploadJob(key, body, content_type)
+        self._queue.put(job, timeout=timeout)
+        return job.future
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def join(self):
+        self._queue.join()
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    job.future.set_result(job.context.run(self._upload, job))
+            except Exception as e:
+                logger.error(f"Failed to upload {job.key} after {self.max_attempts} attempts: {e}")
+                job.future.set_exception(e)
+            finally:
+                job.body = None
+                self._queue.task_done()
+
+    def _upload(self, job):
+        observe('upload.queued', job.submitted)
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                with span('upload.put'):
+                    self.storage.put(job.key, job.body, job.content_type)
+                break
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    raise
+                delay = self.backoff * 2 ** (attempt - 1)
+                logger.warning(f"Upload of {job.key} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+        with span('upload.presign'):
+            return self.storage.url(job.key)
+
+
+def gather(futures):
+    """Future for the results of ``futures`` in order, or the first of their exceptions."""
+    combined = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        errors = [future.exception() for future in futures if future.exception()]
+        if errors:
+            combined.set_exception(errors[0])
+        else:
+            combined.set_result([future.result() for future in futures])
+
+    if not futures:
+        combined.set_result([])
+    for future in futures:
+        future.add_done_callback(done)
+    return combined